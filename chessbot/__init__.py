@@ -0,0 +1,5 @@
+from chessbot.pieces import Piece, PIECE_VALUES
+from chessbot.board import STARTING_FEN, Board, load_position_from_fen, make_move, unmake_move, apply_move
+from chessbot.movegen import generate_moves, get_legal_moves, is_square_attacked, is_checkmate, move_to_uci, parse_uci_move
+from chessbot.evaluation import evaluate_board
+from chessbot.search import SearchController, LazySMPSearch, choose_best_move, iterative_deepening
@@ -0,0 +1,3 @@
+from chessbot.uci import main
+
+main()
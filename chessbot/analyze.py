@@ -0,0 +1,201 @@
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+import multiprocessing
+from collections import deque
+
+from chessbot.pieces import Piece
+from chessbot.board import STARTING_FEN, Board, load_position_from_fen, board_to_fen, find_king, make_move
+from chessbot.movegen import generate_moves, is_square_attacked, move_to_uci, parse_san
+from chessbot.search import MAX_PLY, SearchController, iterative_deepening, principal_variation, clear_move_ordering
+from chessbot import search
+from chessbot.book import read_pgn_games
+from chessbot.uci import format_score
+from chessbot.tablebase import TB_DIRECTORY, tablebases
+from chessbot import evaluation
+from chessbot.evaluation import EVAL_PARAMS_PATH, load_evaluation_parameters
+from chessbot.nnue import NNUE_PATH, network
+
+ANALYSIS_DEPTH = 6
+ANALYSIS_PROCESSES = os.cpu_count() or 1
+# Positions handed out ahead of the one being written, per process; bounds memory however long the input is
+TASKS_PER_PROCESS = 4
+# Bytes read at a time when looking for the last line of an earlier run's output
+RESUME_BLOCK_SIZE = 1 << 16
+
+def read_fens(path):
+    # One FEN or EPD record per line; EPD operations after the position fields are ignored
+    with open(path) as fen_file:
+        for line in fen_file:
+            fields = line.split()
+            if not fields or fields[0].startswith('#'):
+                continue
+            if len(fields) >= 6 and fields[4].isdigit() and fields[5].isdigit():
+                yield " ".join(fields[:6])
+            else:
+                yield " ".join(fields[:4])
+
+def read_pgn_positions(path):
+    # Every position reached in every game, before each move is played
+    for tags, sans in read_pgn_games(path):
+        board = Board()
+        load_position_from_fen(tags.get("FEN", STARTING_FEN), board)
+        for san in sans:
+            move = parse_san(board, san)
+            if move is None:
+                break
+            yield board_to_fen(board)
+            make_move(board, move)
+
+def read_positions(path, pgn=None):
+    if pgn is None:
+        pgn = path.lower().endswith(".pgn")
+    return read_pgn_positions(path) if pgn else read_fens(path)
+
+def analyze_position(index, fen, depth, nodes):
+    board = Board()
+    try:
+        load_position_from_fen(fen, board)
+    except (KeyError, ValueError, IndexError):
+        return {"index": index, "fen": fen, "error": "invalid FEN"}
+    if find_king(board, Piece.Light) is None or find_king(board, Piece.Dark) is None:
+        return {"index": index, "fen": fen, "error": "missing king"}
+    if not generate_moves(board, board.turn):
+        in_check = is_square_attacked(board, find_king(board, board.turn), Piece.Dark if board.turn == Piece.Light else Piece.Light)
+        return {"index": index, "fen": fen, "bestmove": None, "score": "mate 0" if in_check else "cp 0", "pv": [], "depth": 0}
+    # Every position starts from empty tables so its result does not depend on which worker ran what before it
+    search.transposition_table.clear()
+    clear_move_ordering()
+    controller = SearchController(depth, nodes=nodes)
+    best_move, value, completed_depth = iterative_deepening(board, controller, verbose=False)
+    line = principal_variation(board, max(completed_depth, 1))
+    if not line or line[0] != best_move:
+        line = [best_move]
+    stats = controller.stats
+    return {
+        "index": index,
+        "fen": fen,
+        "bestmove": move_to_uci(best_move),
+        "score": format_score(value),
+        "pv": [move_to_uci(move) for move in line],
+        "depth": completed_depth,
+        "nodes": stats.nodes,
+        "time": round(stats.time, 4),
+        "nps": int(stats.nodes / stats.time) if stats.time > 0 else 0,
+        "tt_hit_rate": round(stats.tt_hit_rate(), 4),
+        "first_move_cutoff_rate": round(stats.first_move_cutoff_rate(), 4),
+    }
+
+def init_analysis_worker(tablebase_directory, evaluation_parameters_path, network_path):
+    if tablebase_directory is not None:
+        tablebases.load(tablebase_directory)
+    if evaluation_parameters_path is not None:
+        load_evaluation_parameters(evaluation_parameters_path)
+    if network_path is not None:
+        network.load(network_path)
+
+def analyze_positions(fens, depth=ANALYSIS_DEPTH, nodes=None, processes=ANALYSIS_PROCESSES, start=0):
+    # Yields one result per position, in input order. At most TASKS_PER_PROCESS positions per process are
+    # in flight, so the input is read only as fast as the workers get through it.
+    positions = itertools.islice(enumerate(fens), start, None)
+    if processes <= 1:
+        for index, fen in positions:
+            yield analyze_position(index, fen, depth, nodes)
+        return
+    context = multiprocessing.get_context("spawn")
+    # Workers open whatever tablebases, evaluation parameters and network this process has loaded
+    initargs = (tablebases.directory, evaluation.evaluation_parameters_path, network.path)
+    with context.Pool(processes, initializer=init_analysis_worker, initargs=initargs) as pool:
+        pending = deque()
+        for index, fen in positions:
+            if len(pending) >= processes * TASKS_PER_PROCESS:
+                yield pending.popleft().get()
+            pending.append(pool.apply_async(analyze_position, (index, fen, depth, nodes)))
+        while pending:
+            yield pending.popleft().get()
+
+def line_start(output, end):
+    # Offset just past the last newline before end, or 0; reads backwards from end a block at a time
+    position = end
+    while position > 0:
+        start = max(0, position - RESUME_BLOCK_SIZE)
+        output.seek(start)
+        newline = output.read(position - start).rfind(b"\n")
+        if newline >= 0:
+            return start + newline + 1
+        position = start
+    return 0
+
+def resume_offset(path):
+    # Input position after the last complete line of an earlier run; a line cut off part-way through is dropped.
+    # Only the end of the file is read, however long the earlier run was.
+    if not os.path.exists(path):
+        return 0
+    with open(path, "rb+") as output:
+        size = output.seek(0, os.SEEK_END)
+        complete = line_start(output, size)
+        if complete < size:
+            output.truncate(complete)
+        if not complete:
+            return 0
+        begin = line_start(output, complete - 1)
+        output.seek(begin)
+        return json.loads(output.read(complete - begin))["index"] + 1
+
+def run_analysis(input_path, output_path, depth=ANALYSIS_DEPTH, nodes=None, processes=ANALYSIS_PROCESSES,
+                 start=0, resume=False, pgn=None, progress=sys.stderr):
+    if resume and output_path:
+        # An output with nothing in it yet, or missing, leaves --start as given
+        start = max(start, resume_offset(output_path))
+    output = open(output_path, "a" if resume else "w") if output_path else sys.stdout
+    begin = time.perf_counter()
+    written = 0
+    total_nodes = 0
+    try:
+        for result in analyze_positions(read_positions(input_path, pgn), depth, nodes, processes, start):
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+            written += 1
+            total_nodes += result.get("nodes", 0)
+            if progress is not None and written % 100 == 0:
+                elapsed = time.perf_counter() - begin
+                progress.write(f"{start + written} positions, {written / elapsed:.1f} positions/s, {int(total_nodes / elapsed)} nps\n")
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    return written
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyse every position of a FEN/EPD or PGN file and write JSON lines")
+    parser.add_argument("input", help="file with one FEN per line, or a .pgn file")
+    parser.add_argument("--output", help="JSONL file to write (default standard output)")
+    parser.add_argument("--depth", type=int, help=f"search depth (default {ANALYSIS_DEPTH}, or unlimited with --nodes)")
+    parser.add_argument("--nodes", type=int, help="node budget per position")
+    parser.add_argument("--processes", type=int, default=ANALYSIS_PROCESSES)
+    parser.add_argument("--start", type=int, default=0, help="skip this many positions of the input")
+    parser.add_argument("--resume", action="store_true", help="continue after the positions already in --output")
+    parser.add_argument("--pgn", action="store_true", help="read the input as PGN whatever its extension")
+    parser.add_argument("--tablebases", help=f"tablebase directory (default {TB_DIRECTORY} when it exists)")
+    args = parser.parse_args(argv)
+    if args.resume and not args.output:
+        parser.error("--resume needs --output")
+    depth = args.depth or (MAX_PLY if args.nodes else ANALYSIS_DEPTH)
+    if args.tablebases:
+        tablebases.load(args.tablebases)
+    elif os.path.isdir(TB_DIRECTORY):
+        tablebases.load(TB_DIRECTORY)
+    if os.path.exists(EVAL_PARAMS_PATH):
+        load_evaluation_parameters(EVAL_PARAMS_PATH)
+    if os.path.exists(NNUE_PATH):
+        network.load(NNUE_PATH)
+    try:
+        written = run_analysis(args.input, args.output, depth, args.nodes, args.processes, args.start, args.resume, args.pgn or None)
+    finally:
+        tablebases.close()
+    sys.stderr.write(f"{written} positions analysed\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+import sys
+import time
+import random
+import argparse
+
+import numpy as np
+
+from chessbot.pieces import Piece, PIECES, MAX_PHASE, AI_COLOR_LIGHT, AI_COLOR_DARK, middlegame_tables, endgame_tables, phase_weights
+from chessbot.bitboards import FULL_BOARD, FILE_A, FILE_H, FILES, ADJACENT_FILES
+from chessbot.board import Board, load_position_from_fen, make_move
+from chessbot.movegen import generate_moves
+from chessbot.bench import BENCH_POSITIONS
+from chessbot import evaluation
+from chessbot.evaluation import evaluate_board, evaluate_material, evaluate_pawn_structure, evaluate_mobility, evaluate_king_safety
+
+# evaluate_board for whole batches of positions. A batch is an int8 array of shape (N, 64) holding the piece
+# code on every square (0 when empty), square 0 being a1 as on Board.squares. The terms work on uint64
+# bitboard arrays with the same shifts as the scalar code and give exactly its values. The weights are read
+# when called; the material table is built on import, so call precompute_batch_tables() again after loading
+# other evaluation parameters.
+
+SCALAR_TERMS = {
+    "material": evaluate_material,
+    "pawn_structure": evaluate_pawn_structure,
+    "mobility": evaluate_mobility,
+    "king_safety": evaluate_king_safety,
+}
+# Piece codes stay below this, so they index the lookup tables directly
+CODE_COUNT = 32
+# Positions evaluated together; small enough for the temporaries to stay in cache
+BATCH_SIZE = 4096
+
+def mask(bitboard):
+    return np.uint64(bitboard & FULL_BOARD)
+
+NOT_FILE_A = mask(~FILE_A)
+NOT_FILE_H = mask(~FILE_H)
+NOT_FILES_AB = mask(~(FILE_A | FILES[1]))
+NOT_FILES_GH = mask(~(FILE_H | FILES[6]))
+# (shift, mask) pairs: a positive shift moves up the board, and the mask drops squares that wrapped around a file
+STRAIGHT_STEPS = [(8, None), (-8, None), (1, NOT_FILE_A), (-1, NOT_FILE_H)]
+DIAGONAL_STEPS = [(9, NOT_FILE_A), (7, NOT_FILE_H), (-7, NOT_FILE_A), (-9, NOT_FILE_H)]
+KING_STEPS = STRAIGHT_STEPS + DIAGONAL_STEPS
+KNIGHT_STEPS = [(17, NOT_FILE_A), (15, NOT_FILE_H), (10, NOT_FILES_AB), (6, NOT_FILES_GH),
+                (-6, NOT_FILES_AB), (-10, NOT_FILES_GH), (-15, NOT_FILE_A), (-17, NOT_FILE_H)]
+FILE_MASKS = [mask(file) for file in FILES]
+ADJACENT_FILE_MASKS = [mask(files) for files in ADJACENT_FILES]
+
+# material_values[square * CODE_COUNT + piece] packs the middlegame value, endgame value and phase weight of
+# a piece into one int64, MATERIAL_FIELD_BITS apart, so a single gather and sum adds up all three. The sums
+# over a board stay far inside a field, so the fields are unpacked again exactly.
+MATERIAL_FIELD_BITS = 21
+material_values = np.zeros(64 * CODE_COUNT, dtype=np.int64)
+square_offsets = np.arange(64, dtype=np.intp) * CODE_COUNT
+piece_codes = np.array(PIECES, dtype=np.int8)
+
+def precompute_batch_tables():
+    for piece in PIECES:
+        for square in range(64):
+            material_values[square * CODE_COUNT + piece] = (middlegame_tables[piece][square]
+                                                            + (endgame_tables[piece][square] << MATERIAL_FIELD_BITS)
+                                                            + (phase_weights[piece] << 2 * MATERIAL_FIELD_BITS))
+
+def unpack_field(packed):
+    # Splits off the signed lowest field, returning it and the remaining fields shifted down
+    half = 1 << (MATERIAL_FIELD_BITS - 1)
+    field = ((packed + half) & ((1 << MATERIAL_FIELD_BITS) - 1)) - half
+    return field, (packed - field) >> MATERIAL_FIELD_BITS
+
+def encode_boards(boards):
+    return np.array([[piece or 0 for piece in board.squares] for board in boards], dtype=np.int8)
+
+def encode_fens(fens):
+    boards = []
+    for fen in fens:
+        board = Board()
+        load_position_from_fen(fen, board)
+        boards.append(board)
+    return encode_boards(boards)
+
+def to_planes(encoded):
+    # One 0/1 plane per piece, in PIECES order: shape (N, 12, 64)
+    return (encoded[:, None, :] == piece_codes[None, :, None]).view(np.int8)
+
+def to_bitboards(encoded):
+    # bitboards[piece] is the uint64 bitboard of that piece in every position, like Board.bitboards
+    planes = to_planes(encoded)
+    piece_bitboards = np.packbits(planes, axis=2, bitorder="little").view("<u8")[:, :, 0].T
+    bitboards = np.zeros((CODE_COUNT, encoded.shape[0]), dtype=np.uint64)
+    bitboards[PIECES] = piece_bitboards
+    return bitboards
+
+def shift(bitboards, step, wrap_mask):
+    shifted = bitboards << np.uint64(step) if step > 0 else bitboards >> np.uint64(-step)
+    return shifted & wrap_mask if wrap_mask is not None else shifted
+
+def popcount(bitboards):
+    return np.bitwise_count(bitboards).astype(np.int64)
+
+def occupancy(bitboards, color):
+    return np.bitwise_or.reduce(bitboards[[piece_type | color for piece_type in range(Piece.King, Piece.Queen + 1)]], axis=0)
+
+def batch_material(encoded):
+    middlegame, rest = unpack_field(material_values[encoded + square_offsets].sum(axis=1))
+    endgame, phase = unpack_field(rest)
+    phase = np.minimum(phase, MAX_PHASE)
+    return (middlegame * phase + endgame * (MAX_PHASE - phase)) // MAX_PHASE
+
+def pawn_structure_counts(bitboards):
+    # Connected minus isolated minus doubled pawns of each side: (2, N), Light in row 0
+    counts = np.zeros((2, bitboards.shape[1]), dtype=np.int64)
+    for row, (color, forward) in enumerate([(Piece.Light, 8), (Piece.Dark, -8)]):
+        pawns = bitboards[Piece.Pawn | color]
+        for file in range(8):
+            count = popcount(pawns & FILE_MASKS[file])
+            counts[row] -= np.maximum(count - 1, 0)
+            counts[row] -= np.where(pawns & ADJACENT_FILE_MASKS[file], 0, count)
+        # Connected pawns are defended by another pawn or stand next to one on the same rank
+        defended = shift(pawns, forward + 1, NOT_FILE_A) | shift(pawns, forward - 1, NOT_FILE_H)
+        side_by_side = shift(pawns, 1, NOT_FILE_A) | shift(pawns, -1, NOT_FILE_H)
+        counts[row] += popcount(pawns & (defended | side_by_side))
+    return counts
+
+def batch_pawn_structure(bitboards):
+    counts = pawn_structure_counts(bitboards)
+    return (AI_COLOR_LIGHT * counts[0] + AI_COLOR_DARK * counts[1]) * evaluation.PAWN_STRUCTURE_WEIGHT
+
+def slider_mobility(sliders, empty, targets, steps):
+    # sliders is (k, 2, N); along one direction no square is reached by two sliders of a set, since the
+    # nearer one blocks the other, so counting the union of each direction counts every piece's moves
+    count = np.zeros(sliders.shape, dtype=np.int64)
+    for step, wrap_mask in steps:
+        # Kogge-Stone fill: propagate through empty squares in strides of 1, 2 and 4 steps
+        open_squares = empty & wrap_mask if wrap_mask is not None else empty
+        filled = sliders
+        for stride in [1, 2, 4]:
+            filled = filled | (open_squares & shift(filled, step * stride, None))
+            open_squares = open_squares & shift(open_squares, step * stride, None)
+        count += popcount(shift(filled, step, wrap_mask) & targets)
+    return count
+
+def leaper_mobility(pieces, targets, steps):
+    # Each step sends every piece to a different square, so the per-step counts add up to every piece's moves
+    count = np.zeros(pieces.shape, dtype=np.int64)
+    for step, wrap_mask in steps:
+        count += popcount(shift(pieces, step, wrap_mask) & targets)
+    return count
+
+def mobility_counts(bitboards):
+    # Pseudo-legal mobility: squares each piece attacks that are not occupied by its own side. Returns a
+    # (2, N) array per piece type, Light in row 0; both sides are worked through together.
+    def pieces(piece_type):
+        return bitboards[[piece_type | Piece.Light, piece_type | Piece.Dark]]
+
+    own = np.stack([occupancy(bitboards, Piece.Light), occupancy(bitboards, Piece.Dark)])
+    targets = ~own
+    enemy = own[::-1]
+    empty = ~(own[0] | own[1])
+    pawns = pieces(Piece.Pawn)
+    pushes = np.stack([shift(pawns[0], 8, None), shift(pawns[1], -8, None)])
+    captures = np.stack([shift(pawns[0], 9, NOT_FILE_A) | shift(pawns[0], 7, NOT_FILE_H),
+                         shift(pawns[1], -7, NOT_FILE_A) | shift(pawns[1], -9, NOT_FILE_H)])
+    queens = pieces(Piece.Queen)
+    straight = slider_mobility(np.stack([pieces(Piece.Rook), queens]), empty, targets, STRAIGHT_STEPS)
+    diagonal = slider_mobility(np.stack([pieces(Piece.Bishop), queens]), empty, targets, DIAGONAL_STEPS)
+    return {
+        Piece.Pawn: popcount(pushes & empty) + popcount(captures & enemy),
+        Piece.Knight: leaper_mobility(pieces(Piece.Knight), targets, KNIGHT_STEPS),
+        Piece.Bishop: diagonal[0],
+        Piece.Rook: straight[0],
+        Piece.Queen: straight[1] + diagonal[1],
+        Piece.King: leaper_mobility(pieces(Piece.King), targets, KING_STEPS),
+    }
+
+def batch_mobility(bitboards):
+    moves = sum(counts * evaluation.MOBILITY_WEIGHTS[piece_type] for piece_type, counts in mobility_counts(bitboards).items())
+    return AI_COLOR_LIGHT * moves[0] + AI_COLOR_DARK * moves[1]
+
+def king_safety_counts(bitboards):
+    # Squares around each side's king without a piece of its own: (2, N), Light in row 0, 0 without a king
+    counts = np.zeros((2, bitboards.shape[1]), dtype=np.int64)
+    for row, color in enumerate([Piece.Light, Piece.Dark]):
+        king = bitboards[Piece.King | color]
+        surrounding = np.bitwise_or.reduce([shift(king, step, wrap_mask) for step, wrap_mask in KING_STEPS])
+        counts[row] = np.where(king != 0, 8 - popcount(surrounding & occupancy(bitboards, color)), 0)
+    return counts
+
+def batch_king_safety(bitboards):
+    counts = king_safety_counts(bitboards)
+    return -(AI_COLOR_LIGHT * counts[0] + AI_COLOR_DARK * counts[1]) * evaluation.KING_SAFETY_WEIGHT
+
+def evaluate_terms(encoded):
+    # Every term for every position, from Light's point of view
+    bitboards = to_bitboards(encoded)
+    return {
+        "material": batch_material(encoded),
+        "pawn_structure": batch_pawn_structure(bitboards),
+        "mobility": batch_mobility(bitboards),
+        "king_safety": batch_king_safety(bitboards),
+    }
+
+def evaluate_batch(encoded, batch_size=BATCH_SIZE):
+    # Same values as evaluate_board
+    scores = np.empty(encoded.shape[0], dtype=np.int64)
+    for start in range(0, encoded.shape[0], batch_size):
+        scores[start:start + batch_size] = sum(evaluate_terms(encoded[start:start + batch_size]).values())
+    return scores
+
+def sample_positions(fens, moves_per_game=40, seed=1):
+    # The given positions plus those reached by random play from them
+    rng = random.Random(seed)
+    boards = []
+    for fen in fens:
+        board = Board()
+        load_position_from_fen(fen, board)
+        boards.append(board.clone())
+        for _ in range(moves_per_game):
+            moves = generate_moves(board, board.turn)
+            if not moves:
+                break
+            make_move(board, rng.choice(moves))
+            boards.append(board.clone())
+    return boards
+
+def compare_with_scalar(boards, output=sys.stdout):
+    # Checks every term against the scalar evaluator and reports the speed of both
+    encoded = encode_boards(boards)
+    chunks = [evaluate_terms(encoded[start:start + BATCH_SIZE]) for start in range(0, len(boards), BATCH_SIZE)]
+    mismatches = 0
+    for term, function in SCALAR_TERMS.items():
+        batch = np.concatenate([chunk[term] for chunk in chunks])
+        different = int((batch != np.array([function(board) for board in boards])).sum())
+        mismatches += different
+        output.write(f"{term}: {different} of {len(boards)} positions differ\n")
+
+    start = time.perf_counter()
+    scalar = [evaluate_board(board) for board in boards]
+    scalar_time = time.perf_counter() - start
+    start = time.perf_counter()
+    batch = evaluate_batch(encoded)
+    batch_time = time.perf_counter() - start
+    mismatches += int((batch != np.array(scalar)).sum())
+    output.write(f"evaluate_board: {scalar_time / len(boards) * 1e6:.1f} us per position, "
+                 f"evaluate_batch: {batch_time / len(boards) * 1e6:.1f} us per position ({scalar_time / batch_time:.1f}x)\n")
+    return mismatches
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the NumPy batch evaluator against evaluate_board")
+    parser.add_argument("fens", nargs="?", help="file with one FEN per line (default the bench positions and random play from them)")
+    parser.add_argument("--moves", type=int, default=40, help="random moves played from every position")
+    args = parser.parse_args(argv)
+    if args.fens:
+        with open(args.fens) as fen_file:
+            fens = [line.strip() for line in fen_file if line.strip()]
+    else:
+        fens = BENCH_POSITIONS
+    return 1 if compare_with_scalar(sample_positions(fens, args.moves)) else 0
+
+precompute_batch_tables()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+from chessbot.pieces import Piece
+
+direction_offsets = [8,-8,-1,1,7,-7,9,-9]
+num_squares_to_edge = {}
+
+def precomputed_move_data():
+    for file in range (8):
+        for rank in range(8):
+            num_north=7-rank
+            num_south=rank
+            num_west= file
+            num_east= 7-file
+            square_index=rank*8+file
+            num_squares_to_edge[square_index] = [
+                num_north,
+                num_south,
+                num_west,
+                num_east,
+                min(num_north,num_west),
+                min(num_south,num_east),
+                min(num_north,num_east),
+                min(num_south,num_west)
+            ]
+
+# Bitboards use the same square indexing as Board.squares: bit 0 is a1, bit 63 is h8
+FULL_BOARD = 0xFFFFFFFFFFFFFFFF
+FILE_A = 0x0101010101010101
+FILE_H = FILE_A << 7
+RANK_3 = 0xFF << 16
+RANK_6 = 0xFF << 40
+PROMOTION_RANKS = (0xFF << 56) | 0xFF
+LIGHT_SQUARES = 0x55AA55AA55AA55AA
+FILES = [FILE_A << file for file in range(8)]
+ADJACENT_FILES = [(FILES[file - 1] if file > 0 else 0) | (FILES[file + 1] if file < 7 else 0) for file in range(8)]
+
+knight_attacks = [0] * 64
+king_attacks = [0] * 64
+pawn_attacks = {Piece.Light: [0] * 64, Piece.Dark: [0] * 64}
+ray_masks = [[0] * 64 for _ in range(8)]
+file_masks = [0] * 64
+diagonal_masks = [0] * 64
+anti_diagonal_masks = [0] * 64
+first_rank_attacks = [[0] * 64 for _ in range(8)]
+between_masks = [[0] * 64 for _ in range(64)]
+
+def precompute_attack_tables():
+    for square in range(64):
+        rank, file = square // 8, square % 8
+        for dr, df in [(2, 1), (2, -1), (-2, 1), (-2, -1), (1, 2), (1, -2), (-1, 2), (-1, -2)]:
+            if 0 <= rank + dr < 8 and 0 <= file + df < 8:
+                knight_attacks[square] |= 1 << ((rank + dr) * 8 + file + df)
+        for df in [-1, 1]:
+            if 0 <= file + df < 8:
+                if rank < 7:
+                    pawn_attacks[Piece.Light][square] |= 1 << (square + 8 + df)
+                if rank > 0:
+                    pawn_attacks[Piece.Dark][square] |= 1 << (square - 8 + df)
+        for direction, offset in enumerate(direction_offsets):
+            ray = 0
+            for n in range(1, num_squares_to_edge[square][direction] + 1):
+                target = square + offset * n
+                between_masks[square][target] = ray
+                ray |= 1 << target
+            ray_masks[direction][square] = ray
+            if num_squares_to_edge[square][direction]:
+                king_attacks[square] |= 1 << (square + offset)
+        file_masks[square] = ray_masks[0][square] | ray_masks[1][square]
+        anti_diagonal_masks[square] = ray_masks[4][square] | ray_masks[5][square]
+        diagonal_masks[square] = ray_masks[6][square] | ray_masks[7][square]
+
+    for file in range(8):
+        for inner in range(64):
+            occupied = inner << 1
+            attacks = 0
+            for step in [-1, 1]:
+                target = file + step
+                while 0 <= target < 8:
+                    attacks |= 1 << target
+                    if occupied & (1 << target):
+                        break
+                    target += step
+            first_rank_attacks[file][inner] = attacks
+
+def byte_swap(bitboard):
+    return int.from_bytes(bitboard.to_bytes(8, 'little'), 'big')
+
+def line_attacks(occupied, mask, square):
+    # Hyperbola quintessence: o ^ (o - 2r) for the forward direction, mirrored with a byte swap for the reverse one
+    forward = occupied & mask
+    reverse = byte_swap(forward)
+    forward = (forward - (1 << square)) & FULL_BOARD
+    reverse = (reverse - (1 << (square ^ 56))) & FULL_BOARD
+    return (forward ^ byte_swap(reverse)) & mask
+
+def bishop_attacks(square, occupied):
+    return line_attacks(occupied, diagonal_masks[square], square) | line_attacks(occupied, anti_diagonal_masks[square], square)
+
+def rook_attacks(square, occupied):
+    rank_shift = square & 56
+    rank = first_rank_attacks[square & 7][(occupied >> (rank_shift + 1)) & 63] << rank_shift
+    return line_attacks(occupied, file_masks[square], square) | rank
+
+
+precomputed_move_data()
+precompute_attack_tables()
@@ -0,0 +1,302 @@
+import random
+
+from chessbot.pieces import Piece, PIECES, middlegame_tables, endgame_tables, phase_weights
+from chessbot.bitboards import PROMOTION_RANKS, pawn_attacks
+
+STARTING_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+
+# Castling rights are kept as a bitmask so they can be saved and restored as a single int
+CASTLE_LIGHT_KINGSIDE = 1
+CASTLE_LIGHT_QUEENSIDE = 2
+CASTLE_DARK_KINGSIDE = 4
+CASTLE_DARK_QUEENSIDE = 8
+CASTLE_ALL = 15
+
+# (right, king from, king to, rook square, squares that must be empty, squares that must not be attacked)
+castling_moves = {
+    Piece.Light: [(CASTLE_LIGHT_KINGSIDE, 4, 6, 7, 0x60, 0x70), (CASTLE_LIGHT_QUEENSIDE, 4, 2, 0, 0x0E, 0x1C)],
+    Piece.Dark: [(CASTLE_DARK_KINGSIDE, 60, 62, 63, 0x60 << 56, 0x70 << 56), (CASTLE_DARK_QUEENSIDE, 60, 58, 56, 0x0E << 56, 0x1C << 56)],
+}
+castling_rights_lost = {
+    4: CASTLE_LIGHT_KINGSIDE | CASTLE_LIGHT_QUEENSIDE,
+    0: CASTLE_LIGHT_QUEENSIDE,
+    7: CASTLE_LIGHT_KINGSIDE,
+    60: CASTLE_DARK_KINGSIDE | CASTLE_DARK_QUEENSIDE,
+    56: CASTLE_DARK_QUEENSIDE,
+    63: CASTLE_DARK_KINGSIDE,
+}
+castling_rights_mask = [CASTLE_ALL & ~castling_rights_lost.get(square, 0) for square in range(64)]
+
+zobrist_pieces = {piece: [0] * 64 for piece in PIECES}
+# Same keys as zobrist_pieces for pawns and zero for everything else, so the pawn key can be updated without a branch
+zobrist_pawns = {piece: [0] * 64 for piece in PIECES}
+zobrist_castling = [0] * 16
+zobrist_en_passant = [0] * 8
+zobrist_turn = 0
+
+def precompute_zobrist_keys():
+    global zobrist_turn
+    # Fixed seed so keys are identical between runs
+    rng = random.Random(20240101)
+    for piece in PIECES:
+        zobrist_pieces[piece] = [rng.getrandbits(64) for _ in range(64)]
+        if piece & Piece.TypeMask == Piece.Pawn:
+            zobrist_pawns[piece] = zobrist_pieces[piece]
+    for rights in range(1, 16):
+        zobrist_castling[rights] = rng.getrandbits(64)
+    for file in range(8):
+        zobrist_en_passant[file] = rng.getrandbits(64)
+    zobrist_turn = rng.getrandbits(64)
+
+def en_passant_key(board):
+    # The en passant file only enters the key when a pawn of the side to move can capture there, as in
+    # Polyglot, so a double push nobody can answer en passant does not hide a repetition
+    target = board.en_passant_target
+    if target is None:
+        return 0
+    enemy = Piece.Dark if board.turn == Piece.Light else Piece.Light
+    if pawn_attacks[enemy][target] & board.bitboards[Piece.Pawn | board.turn]:
+        return zobrist_en_passant[target % 8]
+    return 0
+
+def compute_zobrist_key(board):
+    key = 0
+    for square, piece in enumerate(board.squares):
+        if piece:
+            key ^= zobrist_pieces[piece][square]
+    key ^= zobrist_castling[board.castling_rights]
+    key ^= en_passant_key(board)
+    if board.turn == Piece.Dark:
+        key ^= zobrist_turn
+    return key
+
+def compute_pawn_key(board):
+    key = 0
+    for square, piece in enumerate(board.squares):
+        if piece:
+            key ^= zobrist_pawns[piece][square]
+    return key
+
+class Board():
+    def __init__(self):
+        self.squares = [None]*64
+        self.turn = Piece.Light  # Use +1 for Light, -1 for Dark
+        self.selected = None
+        self.legal_moves = []
+        self.castling_rights = CASTLE_ALL
+        self.en_passant_target = None
+        self.halfmove_clock = 0  # plies since the last capture or pawn move
+        self.fullmove_number = 1
+        self.bitboards = {piece: 0 for piece in PIECES}
+        self.occupancy = {Piece.Light: 0, Piece.Dark: 0}
+        self.zobrist_key = zobrist_castling[self.castling_rights]
+        self.pawn_key = 0
+        self.middlegame_score = 0
+        self.endgame_score = 0
+        self.phase = 0
+        # NNUE accumulator, set up by the network on first use
+        self.accumulator = None
+
+    def put_piece(self, square, piece):
+        bit = 1 << square
+        self.squares[square] = piece
+        self.bitboards[piece] |= bit
+        self.occupancy[piece & Piece.ColorMask] |= bit
+        self.zobrist_key ^= zobrist_pieces[piece][square]
+        self.pawn_key ^= zobrist_pawns[piece][square]
+        self.middlegame_score += middlegame_tables[piece][square]
+        self.endgame_score += endgame_tables[piece][square]
+        self.phase += phase_weights[piece]
+        if self.accumulator is not None:
+            self.accumulator.add_piece(piece, square)
+
+    def remove_piece(self, square):
+        piece = self.squares[square]
+        bit = 1 << square
+        self.squares[square] = None
+        self.bitboards[piece] ^= bit
+        self.occupancy[piece & Piece.ColorMask] ^= bit
+        self.zobrist_key ^= zobrist_pieces[piece][square]
+        self.pawn_key ^= zobrist_pawns[piece][square]
+        self.middlegame_score -= middlegame_tables[piece][square]
+        self.endgame_score -= endgame_tables[piece][square]
+        self.phase -= phase_weights[piece]
+        if self.accumulator is not None:
+            self.accumulator.remove_piece(piece, square)
+        return piece
+
+    def clone(self):
+        new_board = Board()
+        new_board.squares = self.squares.copy()
+        new_board.turn = self.turn
+        new_board.selected = self.selected
+        new_board.legal_moves = self.legal_moves.copy()
+        new_board.castling_rights = self.castling_rights
+        new_board.en_passant_target = self.en_passant_target
+        new_board.halfmove_clock = self.halfmove_clock
+        new_board.fullmove_number = self.fullmove_number
+        new_board.bitboards = self.bitboards.copy()
+        new_board.occupancy = self.occupancy.copy()
+        new_board.zobrist_key = self.zobrist_key
+        new_board.pawn_key = self.pawn_key
+        new_board.middlegame_score = self.middlegame_score
+        new_board.endgame_score = self.endgame_score
+        new_board.phase = self.phase
+        new_board.accumulator = self.accumulator.copy() if self.accumulator is not None else None
+        return new_board
+
+def load_position_from_fen(fen, board):
+    piece_type_from_symbol = {
+        'k': Piece.King,
+        'p': Piece.Pawn,
+        'n': Piece.Knight,
+        'b': Piece.Bishop,
+        'r': Piece.Rook,
+        'q': Piece.Queen
+    }
+    fields = fen.split()
+    fen_board = list(fields[0])
+    file = 0
+    rank = 7
+    for char in fen_board:
+        if char == '/':
+            file = 0
+            rank -= 1
+        elif char.isdigit():
+            file += int(char)
+        else:
+            piece_color = Piece.Light if char.isupper() else Piece.Dark
+            piece_type = piece_type_from_symbol[char.lower()]
+            board.put_piece(rank*8 + file, piece_type | piece_color)
+            file += 1
+
+    # Side to move, castling rights, en passant square and move clocks; missing fields keep the board's defaults
+    if len(fields) > 1:
+        board.turn = Piece.Light if fields[1] == 'w' else Piece.Dark
+    if len(fields) > 2:
+        board.castling_rights = 0
+        for symbol, right in [('K', CASTLE_LIGHT_KINGSIDE), ('Q', CASTLE_LIGHT_QUEENSIDE), ('k', CASTLE_DARK_KINGSIDE), ('q', CASTLE_DARK_QUEENSIDE)]:
+            if symbol in fields[2]:
+                board.castling_rights |= right
+    if len(fields) > 3:
+        board.en_passant_target = None if fields[3] == '-' else parse_square(fields[3])
+    if len(fields) > 5:
+        board.halfmove_clock = int(fields[4])
+        board.fullmove_number = int(fields[5])
+    board.zobrist_key = compute_zobrist_key(board)
+
+def board_to_fen(board):
+    symbols = {Piece.King: 'k', Piece.Pawn: 'p', Piece.Knight: 'n', Piece.Bishop: 'b', Piece.Rook: 'r', Piece.Queen: 'q'}
+    rows = []
+    for rank in range(7, -1, -1):
+        row = ""
+        empty = 0
+        for file in range(8):
+            piece = board.squares[rank*8 + file]
+            if piece is None:
+                empty += 1
+                continue
+            if empty:
+                row += str(empty)
+                empty = 0
+            symbol = symbols[piece & Piece.TypeMask]
+            row += symbol.upper() if piece & Piece.Light else symbol
+        rows.append(row + (str(empty) if empty else ""))
+    castling = "".join(symbol for symbol, right in [('K', CASTLE_LIGHT_KINGSIDE), ('Q', CASTLE_LIGHT_QUEENSIDE),
+                                                    ('k', CASTLE_DARK_KINGSIDE), ('q', CASTLE_DARK_QUEENSIDE)]
+                       if board.castling_rights & right)
+    en_passant = square_name(board.en_passant_target) if board.en_passant_target is not None else "-"
+    return (f"{'/'.join(rows)} {'w' if board.turn == Piece.Light else 'b'} {castling or '-'} {en_passant} "
+            f"{board.halfmove_clock} {board.fullmove_number}")
+
+def square_name(index):
+    return "abcdefgh"[index % 8] + str(index // 8 + 1)
+
+def parse_square(name):
+    return (int(name[1]) - 1) * 8 + "abcdefgh".index(name[0])
+
+def find_king(board, color):
+    king = board.bitboards[Piece.King | (Piece.Light if color == Piece.Light else Piece.Dark)]
+    return king.bit_length() - 1 if king else None
+
+def make_move(board, move):
+    from_index, to_index = move[0], move[1]
+    key = board.zobrist_key
+    # Taken before the move changes the pawns it depends on
+    old_en_passant_key = en_passant_key(board)
+    piece = board.remove_piece(from_index)
+    piece_type = piece & Piece.TypeMask
+    color = piece & Piece.ColorMask
+    captured = board.squares[to_index]
+    if captured is not None:
+        board.remove_piece(to_index)
+    elif piece_type == Piece.Pawn and to_index == board.en_passant_target:
+        captured = board.remove_piece(to_index - 8 if color == Piece.Light else to_index + 8)
+
+    # Pawn promotion: moves without an explicit promotion piece promote to a queen
+    promotion = Piece.Empty
+    if piece_type == Piece.Pawn and (1 << to_index) & PROMOTION_RANKS:
+        promotion = move[2] if len(move) > 2 else Piece.Queen
+        piece = promotion | color
+    board.put_piece(to_index, piece)
+
+    # Castling also moves the rook
+    if piece_type == Piece.King and abs(to_index - from_index) == 2:
+        if to_index > from_index:
+            board.put_piece(from_index + 1, board.remove_piece(from_index + 3))
+        else:
+            board.put_piece(from_index - 1, board.remove_piece(from_index - 4))
+
+    undo = (captured, board.castling_rights, board.en_passant_target, promotion, key, board.halfmove_clock)
+    if piece_type == Piece.Pawn or captured is not None:
+        board.halfmove_clock = 0
+    else:
+        board.halfmove_clock += 1
+    if color == Piece.Dark:
+        board.fullmove_number += 1
+    key = board.zobrist_key ^ zobrist_castling[board.castling_rights] ^ zobrist_turn
+    board.castling_rights &= castling_rights_mask[from_index] & castling_rights_mask[to_index]
+    key ^= zobrist_castling[board.castling_rights] ^ old_en_passant_key
+    if piece_type == Piece.Pawn and abs(to_index - from_index) == 16:
+        board.en_passant_target = (from_index + to_index) // 2
+    else:
+        board.en_passant_target = None
+
+    # Switch turn
+    board.turn = Piece.Dark if board.turn == Piece.Light else Piece.Light
+    board.zobrist_key = key ^ en_passant_key(board)
+    return undo
+
+def unmake_move(board, move, undo):
+    from_index, to_index = move[0], move[1]
+    captured, castling_rights, en_passant_target, promotion, key, halfmove_clock = undo
+    board.turn = Piece.Dark if board.turn == Piece.Light else Piece.Light
+    board.halfmove_clock = halfmove_clock
+    if board.turn == Piece.Dark:
+        board.fullmove_number -= 1
+    board.castling_rights = castling_rights
+    board.en_passant_target = en_passant_target
+
+    piece = board.remove_piece(to_index)
+    color = piece & Piece.ColorMask
+    if promotion:
+        piece = Piece.Pawn | color
+    board.put_piece(from_index, piece)
+    piece_type = piece & Piece.TypeMask
+    if captured is not None:
+        if piece_type == Piece.Pawn and to_index == en_passant_target:
+            board.put_piece(to_index - 8 if color == Piece.Light else to_index + 8, captured)
+        else:
+            board.put_piece(to_index, captured)
+    elif piece_type == Piece.King and abs(to_index - from_index) == 2:
+        if to_index > from_index:
+            board.put_piece(from_index + 3, board.remove_piece(from_index + 1))
+        else:
+            board.put_piece(from_index - 4, board.remove_piece(from_index - 1))
+    board.zobrist_key = key
+
+def apply_move(board, move):
+    make_move(board, move)
+
+
+precompute_zobrist_keys()
@@ -0,0 +1,214 @@
+import os
+import re
+import sys
+import mmap
+import random
+import struct
+import argparse
+from collections import defaultdict
+
+from chessbot.pieces import Piece
+from chessbot.bitboards import pawn_attacks
+from chessbot.board import (STARTING_FEN, CASTLE_LIGHT_KINGSIDE, CASTLE_LIGHT_QUEENSIDE, CASTLE_DARK_KINGSIDE,
+                            CASTLE_DARK_QUEENSIDE, Board, load_position_from_fen, make_move)
+from chessbot.movegen import generate_moves, parse_san, move_to_san, is_castling_move
+from chessbot.polyglot_random import POLYGLOT_RANDOM
+
+# Each entry is a big-endian key, move, weight and learn field, sorted by key
+BOOK_ENTRY = struct.Struct('>QHHI')
+BOOK_MAX_PLY = 24
+MAX_WEIGHT = 65535
+# "weighted" picks at random in proportion to the weights, "best" always plays the heaviest move
+BOOK_SELECTION = "weighted"
+
+# Polyglot orders the piece kinds as black pawn, white pawn, black knight, white knight, ... white king
+POLYGLOT_KIND_ORDER = {Piece.Pawn: 0, Piece.Knight: 1, Piece.Bishop: 2, Piece.Rook: 3, Piece.Queen: 4, Piece.King: 5}
+POLYGLOT_CASTLING = [CASTLE_LIGHT_KINGSIDE, CASTLE_LIGHT_QUEENSIDE, CASTLE_DARK_KINGSIDE, CASTLE_DARK_QUEENSIDE]
+POLYGLOT_PROMOTIONS = {1: Piece.Knight, 2: Piece.Bishop, 3: Piece.Rook, 4: Piece.Queen}
+polyglot_piece_offsets = {}
+
+def precompute_polyglot_offsets():
+    for piece_type, order in POLYGLOT_KIND_ORDER.items():
+        polyglot_piece_offsets[piece_type | Piece.Dark] = 64 * (2 * order)
+        polyglot_piece_offsets[piece_type | Piece.Light] = 64 * (2 * order + 1)
+
+def polyglot_key(board):
+    key = 0
+    for square, piece in enumerate(board.squares):
+        if piece is not None:
+            key ^= POLYGLOT_RANDOM[polyglot_piece_offsets[piece] + square]
+    for index, right in enumerate(POLYGLOT_CASTLING):
+        if board.castling_rights & right:
+            key ^= POLYGLOT_RANDOM[768 + index]
+    if board.en_passant_target is not None:
+        # The en passant file only counts when a pawn of the side to move could actually capture
+        enemy = Piece.Dark if board.turn == Piece.Light else Piece.Light
+        if pawn_attacks[enemy][board.en_passant_target] & board.bitboards[Piece.Pawn | board.turn]:
+            key ^= POLYGLOT_RANDOM[772 + board.en_passant_target % 8]
+    if board.turn == Piece.Light:
+        key ^= POLYGLOT_RANDOM[780]
+    return key
+
+def decode_book_move(board, code):
+    # Returns the legal move for a Polyglot move code, or None
+    from_index = (code >> 6) & 63
+    to_index = code & 63
+    promotion = POLYGLOT_PROMOTIONS.get((code >> 12) & 7)
+    piece = board.squares[from_index]
+    if piece is None:
+        return None
+    # Castling is stored as the king capturing its own rook
+    target = board.squares[to_index]
+    if piece & Piece.TypeMask == Piece.King and target == Piece.Rook | board.turn:
+        to_index = from_index + 2 if to_index > from_index else from_index - 2
+    move = (from_index, to_index, promotion) if promotion else (from_index, to_index)
+    if move in generate_moves(board, board.turn, from_mask=1 << from_index):
+        return move
+    return None
+
+def encode_book_move(board, move):
+    to_index = move[1]
+    if is_castling_move(board, move):
+        to_index = move[0] + 3 if move[1] > move[0] else move[0] - 4
+    code = move[0] << 6 | to_index
+    if len(move) > 2:
+        code |= {piece_type: number for number, piece_type in POLYGLOT_PROMOTIONS.items()}[move[2]] << 12
+    return code
+
+class OpeningBook():
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        # An empty file cannot be mapped
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self.num_entries = size // BOOK_ENTRY.size
+
+    def entry(self, index):
+        return BOOK_ENTRY.unpack_from(self.data, index * BOOK_ENTRY.size)
+
+    def find_moves(self, board):
+        # Returns (move, weight) for every legal book move in the position
+        key = polyglot_key(board)
+        low, high = 0, self.num_entries
+        while low < high:
+            middle = (low + high) // 2
+            if self.entry(middle)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        moves = []
+        while low < self.num_entries:
+            entry_key, code, weight, learn = self.entry(low)
+            if entry_key != key:
+                break
+            move = decode_book_move(board, code)
+            if move is not None and weight > 0:
+                moves.append((move, weight))
+            low += 1
+        return moves
+
+    def choose_move(self, board, selection=BOOK_SELECTION, rng=random):
+        moves = self.find_moves(board)
+        if not moves:
+            return None
+        if selection == "best":
+            return max(moves, key=lambda entry: entry[1])[0]
+        return rng.choices([move for move, weight in moves], weights=[weight for move, weight in moves])[0]
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+PGN_RESULTS = {"1-0": Piece.Light, "0-1": Piece.Dark, "1/2-1/2": None}
+PGN_NOISE = re.compile(r"\{[^}]*\}|;[^\n]*|\$\d+|\d+\.(\.\.)?|1-0|0-1|1/2-1/2|\*")
+
+def strip_variations(text):
+    depth = 0
+    kept = []
+    for char in text:
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth = max(depth - 1, 0)
+        elif depth == 0:
+            kept.append(char)
+    return "".join(kept)
+
+def read_pgn_games(path):
+    # Yields (tags, list of SAN moves) for each game in the file
+    tags = {}
+    movetext = []
+    with open(path, encoding="utf-8", errors="replace") as pgn_file:
+        for line in pgn_file:
+            line = line.strip()
+            if line.startswith('['):
+                if movetext:
+                    yield tags, PGN_NOISE.sub(' ', strip_variations("\n".join(movetext))).split()
+                    tags, movetext = {}, []
+                match = re.match(r'\[(\w+)\s+"(.*)"\]', line)
+                if match:
+                    tags[match.group(1)] = match.group(2)
+            elif line and not line.startswith('%'):
+                movetext.append(line)
+    if movetext:
+        yield tags, PGN_NOISE.sub(' ', strip_variations("\n".join(movetext))).split()
+
+def build_book(pgn_path, book_path, max_ply=BOOK_MAX_PLY):
+    weights = defaultdict(int)
+    games = 0
+    for tags, sans in read_pgn_games(pgn_path):
+        board = Board()
+        load_position_from_fen(tags.get("FEN", STARTING_FEN), board)
+        result = tags.get("Result", "*")
+        games += 1
+        for san in sans[:max_ply]:
+            move = parse_san(board, san)
+            if move is None:
+                break
+            # A win counts double, a draw or unknown result once, a loss not at all
+            if result in PGN_RESULTS and PGN_RESULTS[result] is not None:
+                score = 2 if PGN_RESULTS[result] == board.turn else 0
+            else:
+                score = 1
+            weights[(polyglot_key(board), encode_book_move(board, move))] += score
+            make_move(board, move)
+
+    entries = [(key, code, weight) for (key, code), weight in weights.items() if weight > 0]
+    heaviest = max((weight for key, code, weight in entries), default=0)
+    if heaviest > MAX_WEIGHT:
+        entries = [(key, code, max(1, weight * MAX_WEIGHT // heaviest)) for key, code, weight in entries]
+    entries.sort(key=lambda entry: (entry[0], -entry[2], entry[1]))
+    with open(book_path, "wb") as book_file:
+        for key, code, weight in entries:
+            book_file.write(BOOK_ENTRY.pack(key, code, weight, 0))
+    return games, len(entries)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Polyglot opening book tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="build a book from a PGN file")
+    build.add_argument("pgn")
+    build.add_argument("book")
+    build.add_argument("--max-ply", type=int, default=BOOK_MAX_PLY)
+    probe = commands.add_parser("probe", help="list the book moves for a position")
+    probe.add_argument("book")
+    probe.add_argument("--fen", default=STARTING_FEN)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        games, entries = build_book(args.pgn, args.book, args.max_ply)
+        print(f"{games} games, {entries} entries written to {args.book}")
+    else:
+        board = Board()
+        load_position_from_fen(args.fen, board)
+        book = OpeningBook(args.book)
+        for move, weight in sorted(book.find_moves(board), key=lambda entry: -entry[1]):
+            print(f"{move_to_san(board, move)} {weight}")
+        book.close()
+
+precompute_polyglot_offsets()
+
+if __name__ == "__main__":
+    sys.exit(main())
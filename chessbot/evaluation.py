@@ -0,0 +1,253 @@
+import time
+import json
+from array import array
+
+from chessbot.pieces import (Piece, AI_COLOR_LIGHT, AI_COLOR_DARK, MAX_PHASE, PIECE_SQUARE_TABLES, ENDGAME_PIECE_SQUARE_TABLES,
+                             evaluation_piece_values, precompute_evaluation_tables)
+from chessbot.bitboards import FULL_BOARD, FILE_A, FILE_H, FILES, ADJACENT_FILES, knight_attacks, king_attacks, bishop_attacks, rook_attacks
+from chessbot.board import STARTING_FEN, Board, load_position_from_fen, find_king
+from chessbot.movegen import get_legal_moves
+from chessbot.nnue import network
+
+PAWN_STRUCTURE_WEIGHT = 50
+KING_SAFETY_WEIGHT = 50
+
+# Per attacked or reachable square
+MOBILITY_WEIGHTS = {
+    Piece.King: 10,
+    Piece.Queen: 10,
+    Piece.Rook: 10,
+    Piece.Bishop: 10,
+    Piece.Knight: 10,
+    Piece.Pawn: 10,
+}
+
+PAWN_HASH_SIZE_MB = 1
+
+# Tuned evaluation parameters written by chessbot.tune; loaded at startup when the file exists
+EVAL_PARAMS_PATH = "eval_params.json"
+PIECE_NAMES = {
+    Piece.King: "king",
+    Piece.Pawn: "pawn",
+    Piece.Knight: "knight",
+    Piece.Bishop: "bishop",
+    Piece.Rook: "rook",
+    Piece.Queen: "queen",
+}
+# The parameter file this process loaded, handed on to worker processes
+evaluation_parameters_path = None
+
+class PawnHashTable():
+    # Bytes per entry: key (8), score (4), filled flag (1)
+    ENTRY_SIZE = 13
+
+    def __init__(self, size_mb=PAWN_HASH_SIZE_MB):
+        self.size = max(1, size_mb * 1024 * 1024 // self.ENTRY_SIZE)
+        self.keys = array('Q', bytes(8 * self.size))
+        self.scores = array('i', bytes(4 * self.size))
+        self.filled = bytearray(self.size)
+        self.probes = 0
+        self.hits = 0
+
+    def probe(self, key):
+        self.probes += 1
+        index = key % self.size
+        if self.filled[index] and self.keys[index] == key:
+            self.hits += 1
+            return self.scores[index]
+        return None
+
+    def store(self, key, score):
+        index = key % self.size
+        self.keys[index] = key
+        self.scores[index] = score
+        self.filled[index] = 1
+
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+    def clear(self):
+        self.filled = bytearray(self.size)
+
+pawn_hash_table = PawnHashTable()
+
+def evaluate_pawn_structure(board):
+    score = pawn_hash_table.probe(board.pawn_key)
+    if score is not None:
+        return score
+
+    score = 0
+    for color, sign in [(Piece.Light, AI_COLOR_LIGHT), (Piece.Dark, AI_COLOR_DARK)]:
+        pawns = board.bitboards[Piece.Pawn | color]
+        doubled = 0
+        isolated = 0
+        for file in range(8):
+            count = (pawns & FILES[file]).bit_count()
+            if count:
+                doubled += count - 1
+                if not pawns & ADJACENT_FILES[file]:
+                    isolated += count
+        # Connected pawns are defended by another pawn or stand next to one on the same rank
+        if color == Piece.Light:
+            defended = (((pawns << 9) & ~FILE_A) | ((pawns << 7) & ~FILE_H)) & FULL_BOARD
+        else:
+            defended = ((pawns >> 7) & ~FILE_A) | ((pawns >> 9) & ~FILE_H)
+        side_by_side = ((pawns << 1) & ~FILE_A) | ((pawns >> 1) & ~FILE_H)
+        connected = (pawns & (defended | side_by_side)).bit_count()
+        score += sign * (connected - isolated - doubled) * PAWN_STRUCTURE_WEIGHT
+
+    pawn_hash_table.store(board.pawn_key, score)
+    return score
+
+def evaluate_mobility(board):
+    # Pseudo-legal mobility: squares each piece attacks that are not occupied by its own side
+    occupied = board.occupancy[Piece.Light] | board.occupancy[Piece.Dark]
+    empty = ~occupied & FULL_BOARD
+    score = 0
+    for color, sign in [(Piece.Light, AI_COLOR_LIGHT), (Piece.Dark, AI_COLOR_DARK)]:
+        targets = ~board.occupancy[color] & FULL_BOARD
+        enemy = board.occupancy[Piece.Dark if color == Piece.Light else Piece.Light]
+        pawns = board.bitboards[Piece.Pawn | color]
+        if color == Piece.Light:
+            pawn_moves = ((pawns << 8) & empty).bit_count()
+            pawn_moves += ((((pawns << 9) & ~FILE_A) | ((pawns << 7) & ~FILE_H)) & enemy).bit_count()
+        else:
+            pawn_moves = ((pawns >> 8) & empty).bit_count()
+            pawn_moves += ((((pawns >> 7) & ~FILE_A) | ((pawns >> 9) & ~FILE_H)) & enemy).bit_count()
+        score += sign * pawn_moves * MOBILITY_WEIGHTS[Piece.Pawn]
+
+        for piece_type in [Piece.Knight, Piece.Bishop, Piece.Rook, Piece.Queen, Piece.King]:
+            pieces = board.bitboards[piece_type | color]
+            count = 0
+            while pieces:
+                lowest = pieces & -pieces
+                square = lowest.bit_length() - 1
+                if piece_type == Piece.Knight:
+                    attacks = knight_attacks[square]
+                elif piece_type == Piece.Bishop:
+                    attacks = bishop_attacks(square, occupied)
+                elif piece_type == Piece.Rook:
+                    attacks = rook_attacks(square, occupied)
+                elif piece_type == Piece.Queen:
+                    attacks = bishop_attacks(square, occupied) | rook_attacks(square, occupied)
+                else:
+                    attacks = king_attacks[square]
+                count += (attacks & targets).bit_count()
+                pieces ^= lowest
+            score += sign * count * MOBILITY_WEIGHTS[piece_type]
+    return score
+
+def legal_move_mobility(board):
+    # The previous mobility term, counting fully legal moves; only kept as the baseline for benchmark_evaluation
+    light_moves = sum(len(get_legal_moves(board, i)) for i in range(64) if board.squares[i] and (board.squares[i] & Piece.Light))
+    dark_moves = sum(len(get_legal_moves(board, i)) for i in range(64) if board.squares[i] and (board.squares[i] & Piece.Dark))
+    return (light_moves - dark_moves) * MOBILITY_WEIGHTS[Piece.Pawn]
+
+def evaluate_material(board):
+    # Material and piece-square values are kept up to date by the move code, tapered by game phase
+    phase = min(board.phase, MAX_PHASE)
+    return (board.middlegame_score * phase + board.endgame_score * (MAX_PHASE - phase)) // MAX_PHASE
+
+def evaluate_king_safety(board):
+    # Less defended kings are worse: every surrounding square without a piece of the king's own side costs
+    score = 0
+    for color, sign in [(Piece.Light, AI_COLOR_LIGHT), (Piece.Dark, AI_COLOR_DARK)]:
+        king = find_king(board, color)
+        if king is not None:
+            defended = sum(1 for square in get_surrounding_squares(king) if board.squares[square] and (board.squares[square] & color))
+            score -= sign * (8 - defended) * KING_SAFETY_WEIGHT
+    return score
+
+def evaluate_board(board):
+    # A loaded network replaces the hand-written terms
+    if network.loaded:
+        return network.evaluate(board)
+    return evaluate_material(board) + evaluate_pawn_structure(board) + evaluate_mobility(board) + evaluate_king_safety(board)
+
+def evaluation_parameters():
+    # Every tunable value, keyed by piece name; tables are written from Light's point of view with rank 8 first
+    return {
+        "piece_values": {PIECE_NAMES[piece_type]: value for piece_type, value in evaluation_piece_values.items()},
+        "middlegame_tables": {PIECE_NAMES[piece_type]: list(table) for piece_type, table in PIECE_SQUARE_TABLES.items()},
+        "endgame_tables": {PIECE_NAMES[piece_type]: list(table) for piece_type, table in ENDGAME_PIECE_SQUARE_TABLES.items()},
+        "pawn_structure_weight": PAWN_STRUCTURE_WEIGHT,
+        "king_safety_weight": KING_SAFETY_WEIGHT,
+        "mobility_weights": {PIECE_NAMES[piece_type]: weight for piece_type, weight in MOBILITY_WEIGHTS.items()},
+    }
+
+def set_evaluation_parameters(parameters):
+    # Values missing from parameters keep their current setting. Boards set up before this still carry
+    # material scores from the old tables, so it belongs at startup.
+    global PAWN_STRUCTURE_WEIGHT, KING_SAFETY_WEIGHT
+    piece_types = {name: piece_type for piece_type, name in PIECE_NAMES.items()}
+    for name, value in parameters.get("piece_values", {}).items():
+        evaluation_piece_values[piece_types[name]] = int(value)
+    for name, table in parameters.get("middlegame_tables", {}).items():
+        PIECE_SQUARE_TABLES[piece_types[name]] = [int(value) for value in table]
+    for name, table in parameters.get("endgame_tables", {}).items():
+        ENDGAME_PIECE_SQUARE_TABLES[piece_types[name]] = [int(value) for value in table]
+    for name, weight in parameters.get("mobility_weights", {}).items():
+        MOBILITY_WEIGHTS[piece_types[name]] = int(weight)
+    PAWN_STRUCTURE_WEIGHT = int(parameters.get("pawn_structure_weight", PAWN_STRUCTURE_WEIGHT))
+    KING_SAFETY_WEIGHT = int(parameters.get("king_safety_weight", KING_SAFETY_WEIGHT))
+    precompute_evaluation_tables()
+    pawn_hash_table.clear()
+
+def load_evaluation_parameters(path):
+    global evaluation_parameters_path
+    with open(path) as parameters_file:
+        set_evaluation_parameters(json.load(parameters_file))
+    evaluation_parameters_path = path
+
+def save_evaluation_parameters(path, parameters):
+    # One parameter group per line
+    with open(path, "w") as parameters_file:
+        parameters_file.write("{\n" + ",\n".join(f"{json.dumps(name)}: {json.dumps(value)}" for name, value in parameters.items()) + "\n}\n")
+
+BENCHMARK_FENS = [
+    STARTING_FEN,
+    'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+    'r1bq1rk1/pp2bppp/2n1pn2/3p4/2PP4/2N1PN2/PP2BPPP/R2QKB1R w KQ - 0 8',
+    '8/5pk1/6p1/3R4/8/6P1/5PK1/3r4 w - - 0 40',
+]
+
+def benchmark_evaluation(iterations=200):
+    boards = []
+    for fen in BENCHMARK_FENS:
+        board = Board()
+        load_position_from_fen(fen, board)
+        boards.append(board)
+    for name, function in [
+        ("Mobility, legal move count (before)", legal_move_mobility),
+        ("Mobility, attack count (after)", evaluate_mobility),
+        ("evaluate_board", evaluate_board),
+    ]:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            for board in boards:
+                function(board)
+        elapsed = time.perf_counter() - start
+        print(f"{name}: {elapsed / (iterations * len(boards)) * 1e6:.1f} us per position")
+
+precomputed_surrounding = {}
+
+def precompute_surrounding_squares():
+    for index in range(64):
+        surrounding = []
+        rank = index // 8
+        file = index % 8
+        for dr in [-1, 0, 1]:
+            for df in [-1, 0, 1]:
+                if dr == 0 and df == 0:
+                    continue
+                new_rank = rank + dr
+                new_file = file + df
+                if 0 <= new_rank < 8 and 0 <= new_file < 8:
+                    surrounding.append(new_rank * 8 + new_file)
+        precomputed_surrounding[index] = surrounding
+
+def get_surrounding_squares(index):
+    return precomputed_surrounding.get(index, [])
+
+
+precompute_surrounding_squares()
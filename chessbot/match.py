@@ -0,0 +1,445 @@
+import os
+import sys
+import json
+import math
+import time
+import queue
+import argparse
+import datetime
+import threading
+import subprocess
+
+from chessbot.pieces import Piece
+from chessbot.board import STARTING_FEN, Board, load_position_from_fen, board_to_fen, make_move
+from chessbot.movegen import generate_moves, is_checkmate, is_insufficient_material, move_to_san, parse_san, parse_uci_move
+from chessbot.book import read_pgn_games
+
+# Self-play between two engine configurations over UCI. Each side runs as its own engine process, started
+# from its own checkout, so a change can be played against the code it replaces.
+
+MATCH_OPENINGS = [
+    "r1bqkbnr/1ppp1ppp/p1n5/1B2p3/4P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 0 4",
+    "rnbqkb1r/pp2pppp/3p1n2/8/3NP3/2N5/PPP2PPP/R1BQKB1R b KQkq - 2 5",
+    "rnbqkb1r/ppp2ppp/4pn2/3p4/3PP3/2N5/PPP2PPP/R1BQKBNR w KQkq - 2 4",
+    "rn1qkbnr/pp2pppp/2p5/3pPb2/3P4/8/PPP2PPP/RNBQKBNR w KQkq - 1 4",
+    "rnbqkb1r/ppp2ppp/4pn2/3p4/2PP4/2N5/PP2PPPP/R1BQKBNR w KQkq - 2 4",
+    "rnbqk2r/ppp1ppbp/3p1np1/8/2PPP3/2N5/PP3PPP/R1BQKBNR w KQkq - 0 5",
+    "rnbqk2r/pppp1ppp/4pn2/8/1bPP4/2N5/PP2PPPP/R1BQKBNR w KQkq - 2 4",
+    "r1bqkb1r/pppp1ppp/2n2n2/4p3/2P5/2N2N2/PP1PPPPP/R1BQKB1R w KQkq - 4 4",
+    "rnbqkb1r/pp2pppp/2p2n2/3p4/8/5NP1/PPPPPPBP/RNBQK2R w KQkq - 0 4",
+    "r1bqk2r/pppp1ppp/2n2n2/2b1p3/2B1P3/2P2N2/PP1P1PPP/RNBQK2R w KQkq - 1 5",
+    "rnbqkb1r/pp2pppp/2p2n2/8/2pP4/2N2N2/PP2PPPP/R1BQKB1R w KQkq - 0 5",
+    "rnb1kbnr/ppp1pppp/8/q7/8/2N5/PPPP1PPP/R1BQKBNR w KQkq - 2 4",
+]
+MATCH_GAMES = 100
+MATCH_CONCURRENCY = max(1, (os.cpu_count() or 2) // 2)
+# Games still going after this many plies are scored as draws
+MAX_GAME_PLIES = 400
+# Seconds to wait for a bestmove when the engines play without a clock
+ENGINE_TIMEOUT = 300
+# Slack on the clock for process and pipe overhead before a game is lost on time, in seconds
+TIME_MARGIN = 0.1
+SPRT_ALPHA = 0.05
+SPRT_BETA = 0.05
+# Games of each result added when estimating the variance, so a run of identical results still has one
+SPRT_PRIOR_GAMES = 0.5
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class EngineError(Exception):
+    pass
+
+class EngineProcess():
+    # A UCI engine in a child process; a reader thread queues its output so reads can time out
+    def __init__(self, name, path=PACKAGE_ROOT, options=None):
+        self.name = name
+        # Set once the engine has exited or stopped answering; such a process is not used again
+        self.failed = False
+        environment = dict(os.environ, PYTHONPATH=path)
+        try:
+            self.process = subprocess.Popen([sys.executable, "-m", "chessbot"], cwd=path, env=environment, text=True,
+                                            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=1)
+        except OSError as error:
+            raise EngineError(f"{name} could not be started: {error}")
+        self.lines = queue.Queue()
+        threading.Thread(target=self.read_output, daemon=True).start()
+        try:
+            self.send("uci")
+            self.wait_for("uciok", ENGINE_TIMEOUT)
+            for option, value in (options or {}).items():
+                self.send(f"setoption name {option} value {value}")
+            self.ready()
+        except EngineError:
+            self.close()
+            raise
+
+    def read_output(self):
+        for line in self.process.stdout:
+            self.lines.put(line.strip())
+        self.lines.put(None)
+
+    def fail(self, reason):
+        self.failed = True
+        return EngineError(f"{self.name} {reason}")
+
+    def send(self, line):
+        try:
+            self.process.stdin.write(line + "\n")
+            self.process.stdin.flush()
+        except OSError:
+            raise self.fail("has exited")
+
+    def wait_for(self, prefix, timeout):
+        deadline = time.time() + timeout
+        while True:
+            try:
+                line = self.lines.get(timeout=max(deadline - time.time(), 0))
+            except queue.Empty:
+                raise self.fail("did not answer in time")
+            if line is None:
+                raise self.fail("has exited")
+            if line.startswith(prefix):
+                return line
+
+    def ready(self):
+        self.send("isready")
+        self.wait_for("readyok", ENGINE_TIMEOUT)
+
+    def new_game(self):
+        self.send("ucinewgame")
+        self.ready()
+
+    def best_move(self, fen, moves, go, timeout):
+        self.send(f"position fen {fen}" + (f" moves {' '.join(moves)}" if moves else ""))
+        self.send(f"go {go}")
+        return self.wait_for("bestmove", timeout).split()[1]
+
+    def close(self):
+        try:
+            self.send("quit")
+            self.process.wait(timeout=5)
+        except (EngineError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+
+def parse_limits(depth=None, nodes=None, movetime=None, tc=None):
+    # Returns a function giving the go arguments and the time allowed for a move from the two clocks
+    if tc is not None:
+        base, _, increment = tc.partition('+')
+        base, increment = float(base), float(increment or 0)
+
+        def limits(clocks, turn):
+            go = f"wtime {int(clocks[0] * 1000)} btime {int(clocks[1] * 1000)} winc {int(increment * 1000)} binc {int(increment * 1000)}"
+            return go, clocks[turn] + TIME_MARGIN
+        return limits, base, increment
+    if movetime is not None:
+        return lambda clocks, turn: (f"movetime {movetime}", movetime / 1000 + ENGINE_TIMEOUT), None, 0
+    if nodes is not None:
+        return lambda clocks, turn: (f"nodes {nodes}", ENGINE_TIMEOUT), None, 0
+    return lambda clocks, turn: (f"depth {depth or 4}", ENGINE_TIMEOUT), None, 0
+
+def adjudicate(board, key_counts, plies):
+    # Returns (result, termination) once the game is over, otherwise None
+    if not generate_moves(board, board.turn):
+        if is_checkmate(board):
+            return ("0-1" if board.turn == Piece.Light else "1-0"), "checkmate"
+        return "1/2-1/2", "stalemate"
+    if board.halfmove_clock >= 100:
+        return "1/2-1/2", "fifty-move rule"
+    if key_counts.get(board.zobrist_key, 0) >= 3:
+        return "1/2-1/2", "threefold repetition"
+    if is_insufficient_material(board):
+        return "1/2-1/2", "insufficient material"
+    if plies >= MAX_GAME_PLIES:
+        return "1/2-1/2", "move limit"
+    return None
+
+def play_game(engines, fen, limits):
+    # engines is (white, black); returns the result, how the game ended and the moves in SAN
+    go_arguments, base, increment = limits
+    board = Board()
+    load_position_from_fen(fen, board)
+    for turn, engine in enumerate(engines):
+        try:
+            engine.new_game()
+        except EngineError as error:
+            return ("0-1" if turn == 0 else "1-0"), str(error), []
+    clocks = [base, base]
+    moves = []
+    sans = []
+    key_counts = {board.zobrist_key: 1}
+    while True:
+        outcome = adjudicate(board, key_counts, len(moves))
+        if outcome is not None:
+            return outcome[0], outcome[1], sans
+        turn = 0 if board.turn == Piece.Light else 1
+        engine = engines[turn]
+        loss = "0-1" if turn == 0 else "1-0"
+        go, timeout = go_arguments(clocks, turn)
+        start = time.time()
+        try:
+            text = engine.best_move(fen, moves, go, timeout)
+        except EngineError as error:
+            return loss, str(error), sans
+        if base is not None:
+            clocks[turn] -= time.time() - start
+            if clocks[turn] < -TIME_MARGIN:
+                return loss, f"{engine.name} lost on time", sans
+            clocks[turn] += increment
+        try:
+            move = parse_uci_move(board, text)
+        except (ValueError, IndexError):
+            # Not a move at all, which counts the same as an illegal one
+            move = None
+        if move is None:
+            return loss, f"{engine.name} played an illegal move {text}", sans
+        sans.append(move_to_san(board, move))
+        make_move(board, move)
+        moves.append(text)
+        key_counts[board.zobrist_key] = key_counts.get(board.zobrist_key, 0) + 1
+
+def format_pgn(tags, sans, result, fen):
+    board = Board()
+    load_position_from_fen(fen, board)
+    lines = [f'[{name} "{value}"]' for name, value in tags.items()]
+    if fen != STARTING_FEN:
+        lines += ['[SetUp "1"]', f'[FEN "{fen}"]']
+    tokens = []
+    number = board.fullmove_number
+    white_to_move = board.turn == Piece.Light
+    for index, san in enumerate(sans):
+        if white_to_move:
+            tokens.append(f"{number}.")
+        elif index == 0:
+            tokens.append(f"{number}...")
+        tokens.append(san)
+        if not white_to_move:
+            number += 1
+        white_to_move = not white_to_move
+    tokens.append(result)
+    text = ""
+    line = ""
+    for token in tokens:
+        if len(line) + len(token) + 1 > 79:
+            text += line + "\n"
+            line = token
+        else:
+            line = f"{line} {token}" if line else token
+    return "\n".join(lines) + "\n\n" + text + line + "\n\n"
+
+def read_openings(path):
+    # FEN/EPD lines, or the final position of every game in a PGN file
+    if path.lower().endswith(".pgn"):
+        openings = []
+        for tags, sans in read_pgn_games(path):
+            board = Board()
+            load_position_from_fen(tags.get("FEN", STARTING_FEN), board)
+            for san in sans:
+                move = parse_san(board, san)
+                if move is None:
+                    break
+                make_move(board, move)
+            openings.append(board_to_fen(board))
+        return openings
+    with open(path) as opening_file:
+        return [" ".join(line.split()[:6]) for line in opening_file if line.strip() and not line.startswith('#')]
+
+def expected_score(elo):
+    return 1 / (1 + 10 ** (-elo / 400))
+
+def sprt_llr(wins, draws, losses, elo0, elo1):
+    # Log-likelihood ratio of elo1 against elo0, using the normal approximation to the game score
+    games = wins + draws + losses
+    if not games:
+        return 0.0
+    score = (wins + draws / 2) / games
+    prior_games = games + 3 * SPRT_PRIOR_GAMES
+    prior_score = (wins + draws / 2 + 1.5 * SPRT_PRIOR_GAMES) / prior_games
+    variance = (wins + draws / 4 + 1.25 * SPRT_PRIOR_GAMES) / prior_games - prior_score ** 2
+    score0, score1 = expected_score(elo0), expected_score(elo1)
+    return (score1 - score0) * (2 * score - score0 - score1) * games / (2 * variance)
+
+def sprt_bounds(alpha, beta):
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+def elo_estimate(wins, draws, losses):
+    # Elo difference and its 95% error margin, from the score of engine A
+    games = wins + draws + losses
+    if not games:
+        return 0.0, 0.0
+    score = (wins + draws / 2) / games
+    if score <= 0 or score >= 1:
+        return (math.inf if score >= 1 else -math.inf), math.inf
+    variance = (wins + draws / 4) / games - score ** 2
+    deviation = math.sqrt(variance / games)
+    elo = lambda value: -400 * math.log10(1 / min(max(value, 1e-6), 1 - 1e-6) - 1)
+    return elo(score), (elo(score + 1.96 * deviation) - elo(score - 1.96 * deviation)) / 2
+
+class Match():
+    def __init__(self, engine_a, engine_b, limits, openings=MATCH_OPENINGS, games=MATCH_GAMES,
+                 concurrency=MATCH_CONCURRENCY, sprt=None, pgn_path=None, output=sys.stdout):
+        # engine_a and engine_b are (name, path, options); sprt is (elo0, elo1, alpha, beta) or None
+        self.engines = (engine_a, engine_b)
+        self.limits = limits
+        self.openings = openings
+        self.games = games
+        self.concurrency = concurrency
+        self.sprt = sprt
+        self.pgn_path = pgn_path
+        self.output = output
+        self.lock = threading.Lock()
+        self.next_game = 0
+        self.wins = self.draws = self.losses = 0
+        self.sprt_result = None
+        self.terminations = {}
+        self.stopped = False
+
+    def take_game(self):
+        with self.lock:
+            if self.stopped or self.next_game >= self.games:
+                return None
+            self.next_game += 1
+            return self.next_game - 1
+
+    def run_slot(self):
+        # One game at a time with its own pair of engine processes
+        engines = [None, None]
+        try:
+            while True:
+                number = self.take_game()
+                if number is None:
+                    break
+                # Each opening is played twice, with engine A taking each colour once
+                fen = self.openings[(number // 2) % len(self.openings)]
+                a_is_white = number % 2 == 0
+                names = (self.engines[0][0], self.engines[1][0]) if a_is_white else (self.engines[1][0], self.engines[0][0])
+                # An engine that crashed or hung in the last game is replaced by a fresh process; one that
+                # cannot be started loses the game
+                failure = None
+                for index in range(2):
+                    if engines[index] is not None and engines[index].failed:
+                        engines[index].close()
+                        engines[index] = None
+                    if engines[index] is None and failure is None:
+                        try:
+                            engines[index] = EngineProcess(*self.engines[index])
+                        except EngineError as error:
+                            failure = "0-1" if (index == 0) == a_is_white else "1-0", str(error)
+                if failure is not None:
+                    self.record(number, fen, names, failure[0], failure[1], [], a_is_white)
+                    continue
+                pair = (engines[0], engines[1]) if a_is_white else (engines[1], engines[0])
+                result, termination, sans = play_game(pair, fen, self.limits)
+                self.record(number, fen, names, result, termination, sans, a_is_white)
+        finally:
+            for engine in engines:
+                if engine is not None:
+                    engine.close()
+
+    def record(self, number, fen, names, result, termination, sans, a_is_white):
+        with self.lock:
+            if result == "1/2-1/2":
+                self.draws += 1
+            elif (result == "1-0") == a_is_white:
+                self.wins += 1
+            else:
+                self.losses += 1
+            self.terminations[termination] = self.terminations.get(termination, 0) + 1
+            if self.pgn_path:
+                tags = {"Event": "ChessBot match", "Site": "local", "Date": datetime.date.today().strftime("%Y.%m.%d"),
+                        "Round": number + 1, "White": names[0], "Black": names[1], "Result": result,
+                        "Termination": termination}
+                with open(self.pgn_path, "a") as pgn_file:
+                    pgn_file.write(format_pgn(tags, sans, result, fen))
+            line = f"Game {number + 1}: {names[0]} - {names[1]} {result} ({termination}); +{self.wins} ={self.draws} -{self.losses}"
+            if self.sprt is not None:
+                elo0, elo1, alpha, beta = self.sprt
+                llr = sprt_llr(self.wins, self.draws, self.losses, elo0, elo1)
+                lower, upper = sprt_bounds(alpha, beta)
+                line += f", LLR {llr:.2f} [{lower:.2f}, {upper:.2f}]"
+                if llr >= upper or llr <= lower:
+                    # Games already running are finished and counted, but no new ones start
+                    self.sprt_result = "H1 accepted" if llr >= upper else "H0 accepted"
+                    self.stopped = True
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def run(self):
+        if self.pgn_path and os.path.exists(self.pgn_path):
+            os.remove(self.pgn_path)
+        start = time.time()
+        threads = [threading.Thread(target=self.run_slot) for _ in range(min(self.concurrency, self.games))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.summary(time.time() - start)
+
+    def summary(self, elapsed):
+        elo, margin = elo_estimate(self.wins, self.draws, self.losses)
+        games = self.wins + self.draws + self.losses
+        summary = {
+            "engine_a": self.engines[0][0],
+            "engine_b": self.engines[1][0],
+            "games": games,
+            "wins": self.wins,
+            "draws": self.draws,
+            "losses": self.losses,
+            "score": round((self.wins + self.draws / 2) / games, 4) if games else None,
+            "elo": round(elo, 1) if math.isfinite(elo) else str(elo),
+            "elo_margin": round(margin, 1) if math.isfinite(margin) else str(margin),
+            "terminations": self.terminations,
+            "time": round(elapsed, 1),
+        }
+        if self.sprt is not None:
+            elo0, elo1, alpha, beta = self.sprt
+            summary["sprt"] = {"elo0": elo0, "elo1": elo1, "alpha": alpha, "beta": beta,
+                               "llr": round(sprt_llr(self.wins, self.draws, self.losses, elo0, elo1), 3),
+                               "bounds": [round(bound, 3) for bound in sprt_bounds(alpha, beta)],
+                               "result": self.sprt_result or "inconclusive"}
+        return summary
+
+def parse_options(values):
+    options = {}
+    for value in values or []:
+        name, _, setting = value.partition('=')
+        options[name] = setting
+    return options
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play two engine configurations against each other")
+    parser.add_argument("--engine-a", default=PACKAGE_ROOT, help="checkout to run engine A from (default this one)")
+    parser.add_argument("--engine-b", default=PACKAGE_ROOT, help="checkout to run engine B from (default this one)")
+    parser.add_argument("--name-a", default="A")
+    parser.add_argument("--name-b", default="B")
+    parser.add_argument("--option-a", action="append", metavar="NAME=VALUE", help="UCI option for engine A, repeatable")
+    parser.add_argument("--option-b", action="append", metavar="NAME=VALUE", help="UCI option for engine B, repeatable")
+    parser.add_argument("--games", type=int, default=MATCH_GAMES)
+    parser.add_argument("--concurrency", type=int, default=MATCH_CONCURRENCY, help="games played at once")
+    parser.add_argument("--openings", help="FEN/EPD or PGN file of starting positions")
+    limit = parser.add_mutually_exclusive_group()
+    limit.add_argument("--depth", type=int)
+    limit.add_argument("--nodes", type=int)
+    limit.add_argument("--movetime", type=int, help="milliseconds per move")
+    limit.add_argument("--tc", help="clock per game as base+increment in seconds, e.g. 10+0.1")
+    parser.add_argument("--sprt", nargs=2, type=float, metavar=("ELO0", "ELO1"), help="stop once a sequential probability ratio test decides")
+    parser.add_argument("--alpha", type=float, default=SPRT_ALPHA)
+    parser.add_argument("--beta", type=float, default=SPRT_BETA)
+    parser.add_argument("--pgn", help="write the games to this PGN file")
+    parser.add_argument("--summary", help="write the summary to this JSON file")
+    args = parser.parse_args(argv)
+
+    openings = read_openings(args.openings) if args.openings else MATCH_OPENINGS
+    sprt = (args.sprt[0], args.sprt[1], args.alpha, args.beta) if args.sprt else None
+    match = Match((args.name_a, args.engine_a, parse_options(args.option_a)), (args.name_b, args.engine_b, parse_options(args.option_b)),
+                  parse_limits(args.depth, args.nodes, args.movetime, args.tc), openings, args.games, args.concurrency, sprt, args.pgn)
+    summary = match.run()
+    print(f"\n{summary['engine_a']} vs {summary['engine_b']}: +{summary['wins']} ={summary['draws']} -{summary['losses']} "
+          f"in {summary['games']} games, Elo {summary['elo']} +/- {summary['elo_margin']}")
+    if sprt is not None:
+        print(f"SPRT [{sprt[0]}, {sprt[1]}]: LLR {summary['sprt']['llr']}, {summary['sprt']['result']}")
+    if args.summary:
+        with open(args.summary, "w") as summary_file:
+            json.dump(summary, summary_file, indent=2)
+
+if __name__ == "__main__":
+    main()
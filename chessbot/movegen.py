@@ -0,0 +1,291 @@
+from chessbot.pieces import Piece, PROMOTION_PIECES
+from chessbot.bitboards import (FULL_BOARD, RANK_3, RANK_6, PROMOTION_RANKS, LIGHT_SQUARES, knight_attacks, king_attacks, pawn_attacks,
+                                ray_masks, file_masks, diagonal_masks, anti_diagonal_masks, between_masks,
+                                bishop_attacks, rook_attacks)
+from chessbot.board import castling_moves, find_king, square_name, parse_square, make_move, unmake_move
+
+def attackers_to(board, square, attacker_color, occupied):
+    bitboards = board.bitboards
+    queens = bitboards[Piece.Queen | attacker_color]
+    defender_color = Piece.Dark if attacker_color == Piece.Light else Piece.Light
+    return ((knight_attacks[square] & bitboards[Piece.Knight | attacker_color])
+            | (pawn_attacks[defender_color][square] & bitboards[Piece.Pawn | attacker_color])
+            | (king_attacks[square] & bitboards[Piece.King | attacker_color])
+            | (bishop_attacks(square, occupied) & (bitboards[Piece.Bishop | attacker_color] | queens))
+            | (rook_attacks(square, occupied) & (bitboards[Piece.Rook | attacker_color] | queens)))
+
+def is_square_attacked(board, square, attacker_color, occupied=None):
+    # Look outward from the target square: a piece attacks it exactly when the same piece standing there would attack back
+    bitboards = board.bitboards
+    if knight_attacks[square] & bitboards[Piece.Knight | attacker_color]:
+        return True
+    if pawn_attacks[Piece.Dark if attacker_color == Piece.Light else Piece.Light][square] & bitboards[Piece.Pawn | attacker_color]:
+        return True
+    if king_attacks[square] & bitboards[Piece.King | attacker_color]:
+        return True
+    if occupied is None:
+        occupied = board.occupancy[Piece.Light] | board.occupancy[Piece.Dark]
+    queens = bitboards[Piece.Queen | attacker_color]
+    diagonal = (bitboards[Piece.Bishop | attacker_color] | queens) & (diagonal_masks[square] | anti_diagonal_masks[square])
+    if diagonal and bishop_attacks(square, occupied) & diagonal:
+        return True
+    straight = (bitboards[Piece.Rook | attacker_color] | queens) & (file_masks[square] | ray_masks[2][square] | ray_masks[3][square])
+    if straight and rook_attacks(square, occupied) & straight:
+        return True
+    return False
+
+def generate_moves(board, color, from_mask=FULL_BOARD, legal=True, captures=True, quiets=True):
+    # captures covers captures, en passant and promotions; quiets covers every other move
+    moves = []
+    bitboards = board.bitboards
+    enemy_color = Piece.Dark if color == Piece.Light else Piece.Light
+    own = board.occupancy[color]
+    enemy = board.occupancy[enemy_color]
+    occupied = own | enemy
+    empty = ~occupied & FULL_BOARD
+    targets = (enemy if captures else 0) | (empty if quiets else 0)
+    king = bitboards[Piece.King | color]
+    king_square = king.bit_length() - 1
+
+    # Checkers and pins are worked out once for the position, so no move has to be made to test its legality
+    checkers = attackers_to(board, king_square, enemy_color, occupied) if legal else 0
+    evasions = FULL_BOARD
+    pins = {}
+    if legal:
+        if checkers:
+            # Squares that capture the checking piece or block its line
+            evasions = between_masks[king_square][checkers.bit_length() - 1] | checkers
+        queens = bitboards[Piece.Queen | enemy_color]
+        snipers = ((rook_attacks(king_square, enemy) & (bitboards[Piece.Rook | enemy_color] | queens))
+                   | (bishop_attacks(king_square, enemy) & (bitboards[Piece.Bishop | enemy_color] | queens)))
+        while snipers:
+            sniper = snipers & -snipers
+            line = between_masks[king_square][sniper.bit_length() - 1]
+            blockers = line & occupied
+            if blockers & own and not blockers & (blockers - 1):
+                # A pinned piece may only move along the line between its king and the pinning piece
+                pins[blockers.bit_length() - 1] = line | sniper
+            snipers ^= sniper
+
+    # King moves: the destination must still be safe once the king has left its square
+    if king & from_mask:
+        attacks = king_attacks[king_square] & targets
+        without_king = occupied ^ king
+        while attacks:
+            target = attacks & -attacks
+            to_index = target.bit_length() - 1
+            if not legal or not is_square_attacked(board, to_index, enemy_color, without_king):
+                moves.append((king_square, to_index))
+            attacks ^= target
+        if quiets and not checkers:
+            for right, king_from, king_to, rook_square, empty_mask, safe_mask in castling_moves[color]:
+                if not board.castling_rights & right or king_square != king_from:
+                    continue
+                if not (bitboards[Piece.Rook | color] >> rook_square) & 1 or occupied & empty_mask:
+                    continue
+                if not any(is_square_attacked(board, square, enemy_color) for square in range(64) if (safe_mask >> square) & 1):
+                    moves.append((king_from, king_to))
+
+    # In double check only the king can move
+    if checkers & (checkers - 1):
+        return moves
+
+    # Pawn pushes are generated for all pawns at once by shifting the pawn bitboard
+    pawns = bitboards[Piece.Pawn | color] & from_mask
+    if color == Piece.Light:
+        push = 8
+        single = (pawns << 8) & empty
+        double = ((single & RANK_3) << 8) & empty
+    else:
+        push = -8
+        single = (pawns >> 8) & empty
+        double = ((single & RANK_6) >> 8) & empty
+    single &= evasions & ((PROMOTION_RANKS if captures else 0) | (~PROMOTION_RANKS if quiets else 0))
+    double &= evasions if quiets else 0
+    while single:
+        lowest = single & -single
+        to_index = lowest.bit_length() - 1
+        from_index = to_index - push
+        if from_index not in pins or lowest & pins[from_index]:
+            if lowest & PROMOTION_RANKS:
+                for promotion in PROMOTION_PIECES:
+                    moves.append((from_index, to_index, promotion))
+            else:
+                moves.append((from_index, to_index))
+        single ^= lowest
+    while double:
+        lowest = double & -double
+        to_index = lowest.bit_length() - 1
+        from_index = to_index - 2 * push
+        if from_index not in pins or lowest & pins[from_index]:
+            moves.append((from_index, to_index))
+        double ^= lowest
+    attack_table = pawn_attacks[color]
+    while pawns and captures:
+        lowest = pawns & -pawns
+        from_index = lowest.bit_length() - 1
+        attacks = attack_table[from_index] & enemy & evasions
+        if from_index in pins:
+            attacks &= pins[from_index]
+        while attacks:
+            target = attacks & -attacks
+            to_index = target.bit_length() - 1
+            if target & PROMOTION_RANKS:
+                for promotion in PROMOTION_PIECES:
+                    moves.append((from_index, to_index, promotion))
+            else:
+                moves.append((from_index, to_index))
+            attacks ^= target
+        pawns ^= lowest
+
+    # En passant removes two pawns from one rank, so it is checked against the resulting occupancy directly
+    # The en-passant target only belongs to the side to move
+    if captures and board.en_passant_target is not None and color == board.turn:
+        target = board.en_passant_target
+        captured = 1 << (target - push)
+        capturers = pawn_attacks[enemy_color][target] & bitboards[Piece.Pawn | color] & from_mask
+        while capturers:
+            lowest = capturers & -capturers
+            after = (occupied ^ lowest ^ captured) | (1 << target)
+            if not legal or not attackers_to(board, king_square, enemy_color, after) & ~captured:
+                moves.append((lowest.bit_length() - 1, target))
+            capturers ^= lowest
+
+    for piece_type in [Piece.Knight, Piece.Bishop, Piece.Rook, Piece.Queen]:
+        pieces = bitboards[piece_type | color] & from_mask
+        while pieces:
+            lowest = pieces & -pieces
+            from_index = lowest.bit_length() - 1
+            if piece_type == Piece.Knight:
+                attacks = knight_attacks[from_index]
+            elif piece_type == Piece.Bishop:
+                attacks = bishop_attacks(from_index, occupied)
+            elif piece_type == Piece.Rook:
+                attacks = rook_attacks(from_index, occupied)
+            else:
+                attacks = bishop_attacks(from_index, occupied) | rook_attacks(from_index, occupied)
+            attacks &= targets & evasions
+            if from_index in pins:
+                attacks &= pins[from_index]
+            while attacks:
+                target = attacks & -attacks
+                moves.append((from_index, target.bit_length() - 1))
+                attacks ^= target
+            pieces ^= lowest
+    return moves
+
+def get_legal_moves(board, index, check_check=True):
+    piece = board.squares[index]
+    if not piece:
+        return []
+    moves = generate_moves(board, piece & Piece.ColorMask, 1 << index, legal=check_check)
+    # Promotions produce one move per promotion piece; callers only need the target squares
+    return list(dict.fromkeys(move[1] for move in moves))
+
+def is_checkmate(board):
+    if generate_moves(board, board.turn):
+        return False
+    return is_square_attacked(board, find_king(board, board.turn), Piece.Dark if board.turn == Piece.Light else Piece.Light)
+
+def is_insufficient_material(board):
+    # Neither side can ever mate: bare kings, or a single minor piece, or bishops all on one colour of square
+    pawns_and_majors = 0
+    for piece_type in (Piece.Pawn, Piece.Rook, Piece.Queen):
+        pawns_and_majors |= board.bitboards[piece_type | Piece.Light] | board.bitboards[piece_type | Piece.Dark]
+    if pawns_and_majors:
+        return False
+    knights = board.bitboards[Piece.Knight | Piece.Light] | board.bitboards[Piece.Knight | Piece.Dark]
+    bishops = board.bitboards[Piece.Bishop | Piece.Light] | board.bitboards[Piece.Bishop | Piece.Dark]
+    if not knights:
+        return not (bishops & LIGHT_SQUARES) or not (bishops & ~LIGHT_SQUARES)
+    return not bishops and knights & (knights - 1) == 0
+
+PROMOTION_SYMBOLS = {Piece.Queen: 'q', Piece.Rook: 'r', Piece.Bishop: 'b', Piece.Knight: 'n'}
+
+def move_to_uci(move):
+    # Long algebraic notation as used by UCI, e.g. e2e4 or e7e8q
+    text = square_name(move[0]) + square_name(move[1])
+    if len(move) > 2:
+        text += PROMOTION_SYMBOLS[move[2]]
+    return text
+
+def parse_uci_move(board, text):
+    # Returns the matching legal move, or None if the text is not a legal move in this position
+    for move in generate_moves(board, board.turn, from_mask=1 << parse_square(text[0:2])):
+        if move_to_uci(move) == text:
+            return move
+    return None
+
+SAN_PIECES = {'N': Piece.Knight, 'B': Piece.Bishop, 'R': Piece.Rook, 'Q': Piece.Queen, 'K': Piece.King}
+SAN_SYMBOLS = {piece_type: symbol for symbol, piece_type in SAN_PIECES.items()}
+
+def is_castling_move(board, move):
+    return board.squares[move[0]] & Piece.TypeMask == Piece.King and abs(move[1] - move[0]) == 2
+
+def parse_san(board, text):
+    # Returns the legal move written in standard algebraic notation, or None if it is illegal or ambiguous
+    text = text.rstrip('+#!?')
+    moves = generate_moves(board, board.turn)
+    if text in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+        to_file = 6 if len(text) == 3 else 2
+        for move in moves:
+            if is_castling_move(board, move) and move[1] % 8 == to_file:
+                return move
+        return None
+    promotion = None
+    if '=' in text:
+        text, symbol = text.split('=', 1)
+        promotion = SAN_PIECES.get(symbol.upper())
+    elif len(text) > 2 and text[-1] in 'NBRQ' and text[0] in 'abcdefgh':
+        promotion = SAN_PIECES[text[-1]]
+        text = text[:-1]
+    piece_type = SAN_PIECES.get(text[0], Piece.Pawn)
+    if piece_type != Piece.Pawn:
+        text = text[1:]
+    text = text.replace('x', '').replace('-', '')
+    if len(text) < 2 or text[-2] not in 'abcdefgh' or text[-1] not in '12345678':
+        return None
+    to_index = parse_square(text[-2:])
+    # Whatever is left is the file and/or rank of the moving piece
+    qualifier = text[:-2]
+    candidates = []
+    for move in moves:
+        if move[1] != to_index or board.squares[move[0]] & Piece.TypeMask != piece_type:
+            continue
+        if (move[2] if len(move) > 2 else None) != promotion:
+            continue
+        if any(char not in square_name(move[0]) for char in qualifier):
+            continue
+        candidates.append(move)
+    return candidates[0] if len(candidates) == 1 else None
+
+def move_to_san(board, move):
+    piece = board.squares[move[0]]
+    piece_type = piece & Piece.TypeMask
+    if is_castling_move(board, move):
+        text = 'O-O' if move[1] > move[0] else 'O-O-O'
+    else:
+        capture = board.squares[move[1]] is not None or (piece_type == Piece.Pawn and move[1] == board.en_passant_target)
+        if piece_type == Piece.Pawn:
+            text = (square_name(move[0])[0] + 'x' if capture else '') + square_name(move[1])
+            if len(move) > 2:
+                text += '=' + SAN_SYMBOLS[move[2]]
+        else:
+            # Disambiguate against other pieces of the same kind that can reach the square
+            others = [other[0] for other in generate_moves(board, board.turn, from_mask=board.bitboards[piece])
+                      if other[1] == move[1] and other[0] != move[0] and board.squares[other[0]] == piece]
+            qualifier = ''
+            if others:
+                if all(other % 8 != move[0] % 8 for other in others):
+                    qualifier = square_name(move[0])[0]
+                elif all(other // 8 != move[0] // 8 for other in others):
+                    qualifier = square_name(move[0])[1]
+                else:
+                    qualifier = square_name(move[0])
+            text = SAN_SYMBOLS[piece_type] + qualifier + ('x' if capture else '') + square_name(move[1])
+    undo = make_move(board, move)
+    enemy = Piece.Dark if board.turn == Piece.Light else Piece.Light
+    if is_square_attacked(board, find_king(board, board.turn), enemy):
+        text += '#' if not generate_moves(board, board.turn) else '+'
+    unmake_move(board, move, undo)
+    return text
@@ -0,0 +1,156 @@
+import struct
+
+import numpy as np
+
+from chessbot.pieces import Piece, PIECES
+
+# Small NNUE-style evaluator. The first layer sees 768 inputs per side, one for every piece on every square,
+# from that side's point of view. Its output for both sides (the accumulators) is kept on the board and only
+# changed by the columns of the pieces that move, so a move costs a handful of vector additions. The rest of
+# the network runs on the accumulators of the side to move and the other side. The dense layers hold int16
+# weights and sum into int32, but are kept as float64, which represents every such sum exactly and lets the
+# products go through BLAS instead of NumPy's much slower integer matrix product.
+#
+# File format, little-endian: the header, one uint32 output size per dense layer, then the feature
+# weights (int16, 768 x hidden), the feature biases (int16, hidden) and for every dense layer its weights
+# (int16, outputs x inputs) and biases (int32, outputs). The first dense layer takes 2 x hidden inputs and
+# the last one has a single output.
+
+NNUE_PATH = "network.nnue"
+NNUE_MAGIC = b"CBNN"
+NNUE_VERSION = 1
+# Magic, version, hidden size, number of dense layers
+NNUE_HEADER = struct.Struct('<4sIII')
+FEATURE_COUNT = 768
+NNUE_HIDDEN = 128
+NNUE_LAYERS = [32, 1]
+# Quantisation: activations are clipped to [0, ACTIVATION_SCALE], which stands for [0, 1]; dense weights
+# are multiplied by WEIGHT_SCALE; a network output of 1.0 is OUTPUT_SCALE centipawns
+ACTIVATION_SCALE = 255
+WEIGHT_SCALE = 64
+OUTPUT_SCALE = 400
+
+# Clipping bounds in the accumulator's own type, which keeps the clip from converting the array
+ACTIVATION_LOW = np.int16(0)
+ACTIVATION_HIGH = np.int16(ACTIVATION_SCALE)
+
+# feature_indices[piece][square] is the input of the piece for Light and for Dark. Each side sees its own
+# pieces first and the board from its own side, so Dark's squares are flipped vertically.
+feature_indices = {piece: [None] * 64 for piece in PIECES}
+
+def precompute_feature_indices():
+    for piece in PIECES:
+        piece_index = (piece & Piece.TypeMask) - Piece.King
+        for square in range(64):
+            light = (0 if piece & Piece.Light else 6) + piece_index
+            dark = (0 if piece & Piece.Dark else 6) + piece_index
+            feature_indices[piece][square] = (light * 64 + square, dark * 64 + (square ^ 56))
+
+class Accumulator():
+    # First layer output for Light (row 0) and Dark (row 1). Kept on Board and updated by put_piece and
+    # remove_piece, which make_move and unmake_move go through for every piece they move.
+    def __init__(self, values):
+        self.values = values
+
+    def add_piece(self, piece, square):
+        self.values += network.columns[piece][square]
+
+    def remove_piece(self, piece, square):
+        self.values -= network.columns[piece][square]
+
+    def copy(self):
+        return Accumulator(self.values.copy())
+
+class Network():
+    def __init__(self):
+        self.loaded = False
+        self.path = None
+        self.feature_weights = None
+        self.feature_bias = None
+        self.layers = []
+        # columns[piece][square] holds the feature weights of the piece for both sides, shape (2, hidden)
+        self.columns = {}
+
+    def load(self, path):
+        with open(path, "rb") as network_file:
+            data = network_file.read()
+        magic, version, hidden, layer_count = NNUE_HEADER.unpack_from(data)
+        if magic != NNUE_MAGIC or version != NNUE_VERSION:
+            raise ValueError(f"{path} is not a version {NNUE_VERSION} network")
+        offset = NNUE_HEADER.size
+        sizes = list(struct.unpack_from(f"<{layer_count}I", data, offset))
+        offset += 4 * layer_count
+        if not sizes or sizes[-1] != 1:
+            raise ValueError(f"{path}: the last layer must have a single output")
+
+        def read(dtype, shape):
+            nonlocal offset
+            count = int(np.prod(shape))
+            array = np.frombuffer(data, dtype=dtype, count=count, offset=offset).reshape(shape)
+            offset += array.nbytes
+            return array
+
+        self.feature_weights = read("<i2", (FEATURE_COUNT, hidden))
+        self.feature_bias = read("<i2", (hidden,))
+        self.layers = []
+        inputs = 2 * hidden
+        for outputs in sizes:
+            weights = read("<i2", (outputs, inputs)).astype(np.float64)
+            self.layers.append((weights, read("<i4", (outputs,)).astype(np.float64)))
+            inputs = outputs
+        if offset != len(data):
+            raise ValueError(f"{path}: {len(data) - offset} bytes left over")
+        self.columns = {piece: [np.stack([self.feature_weights[light], self.feature_weights[dark]])
+                                for light, dark in feature_indices[piece]] for piece in PIECES}
+        self.path = path
+        self.loaded = True
+        return hidden, sizes
+
+    def close(self):
+        # Boards keep their accumulators, so columns stay until another network replaces them
+        self.loaded = False
+        self.path = None
+
+    def refresh(self, board):
+        # Accumulator computed from scratch
+        values = np.stack([self.feature_bias, self.feature_bias]).astype(np.int16)
+        for square, piece in enumerate(board.squares):
+            if piece is not None:
+                values += self.columns[piece][square]
+        return Accumulator(values)
+
+    def evaluate(self, board):
+        # Centipawns from Light's point of view, like evaluate_board
+        if board.accumulator is None:
+            board.accumulator = self.refresh(board)
+        values = board.accumulator.values
+        # The side to move's accumulator comes first
+        if board.turn == Piece.Dark:
+            values = values[::-1]
+        hidden = values.ravel().clip(ACTIVATION_LOW, ACTIVATION_HIGH).astype(np.float64)
+        for weights, bias in self.layers[:-1]:
+            hidden = ((weights @ hidden + bias) // WEIGHT_SCALE).clip(0, ACTIVATION_SCALE)
+        weights, bias = self.layers[-1]
+        score = int((weights @ hidden + bias)[0]) * OUTPUT_SCALE // (ACTIVATION_SCALE * WEIGHT_SCALE)
+        return score if board.turn == Piece.Light else -score
+
+network = Network()
+
+def quantize_network(feature_weights, feature_bias, layers):
+    # Float weights, as an offline trainer produces them, in the integer form the engine runs
+    quantized = [(np.round(np.asarray(weights) * WEIGHT_SCALE).astype(np.int16),
+                  np.round(np.asarray(bias) * ACTIVATION_SCALE * WEIGHT_SCALE).astype(np.int32)) for weights, bias in layers]
+    return (np.round(np.asarray(feature_weights) * ACTIVATION_SCALE).astype(np.int16),
+            np.round(np.asarray(feature_bias) * ACTIVATION_SCALE).astype(np.int16), quantized)
+
+def save_network(path, feature_weights, feature_bias, layers):
+    with open(path, "wb") as network_file:
+        network_file.write(NNUE_HEADER.pack(NNUE_MAGIC, NNUE_VERSION, feature_weights.shape[1], len(layers)))
+        network_file.write(struct.pack(f"<{len(layers)}I", *(weights.shape[0] for weights, bias in layers)))
+        network_file.write(feature_weights.astype("<i2").tobytes())
+        network_file.write(feature_bias.astype("<i2").tobytes())
+        for weights, bias in layers:
+            network_file.write(weights.astype("<i2").tobytes())
+            network_file.write(bias.astype("<i4").tobytes())
+
+precompute_feature_indices()
@@ -0,0 +1,90 @@
+import sys
+import time
+import random
+import argparse
+
+import numpy as np
+
+from chessbot.board import Board, load_position_from_fen, make_move, unmake_move
+from chessbot.movegen import generate_moves
+from chessbot.bench import BENCH_POSITIONS
+from chessbot.nnue import FEATURE_COUNT, NNUE_HIDDEN, NNUE_LAYERS, network, quantize_network, save_network
+
+# Command line tools for chessbot.nnue, kept apart from it because importing the package already imports
+# the evaluator, and running that module as __main__ would set up a second network beside the one in use
+
+def random_network(hidden=NNUE_HIDDEN, sizes=NNUE_LAYERS, seed=0):
+    # Small random float weights, a starting point for training and for checking the plumbing
+    rng = np.random.default_rng(seed)
+    feature_weights = rng.normal(0, 0.1, (FEATURE_COUNT, hidden))
+    feature_bias = rng.uniform(0, 0.5, hidden)
+    layers = []
+    inputs = 2 * hidden
+    for outputs in sizes:
+        layers.append((rng.normal(0, 1 / np.sqrt(inputs), (outputs, inputs)), np.zeros(outputs)))
+        inputs = outputs
+    return feature_weights, feature_bias, layers
+
+def check_network(fens, games_per_position=4, plies=60, seed=1, output=sys.stdout):
+    # Plays random moves forward and back again, comparing the incremental accumulators with fresh ones
+    rng = random.Random(seed)
+    mismatches = 0
+    evaluations = 0
+    incremental_time = 0.0
+    refresh_time = 0.0
+    for fen in fens:
+        for _ in range(games_per_position):
+            board = Board()
+            load_position_from_fen(fen, board)
+            board.accumulator = network.refresh(board)
+            history = []
+            for _ in range(plies):
+                moves = generate_moves(board, board.turn)
+                if not moves:
+                    break
+                move = rng.choice(moves)
+                history.append((move, make_move(board, move)))
+                start = time.perf_counter()
+                network.evaluate(board)
+                incremental_time += time.perf_counter() - start
+                start = time.perf_counter()
+                fresh = network.refresh(board)
+                refresh_time += time.perf_counter() - start
+                evaluations += 1
+                mismatches += int(not np.array_equal(board.accumulator.values, fresh.values))
+            while history:
+                move, undo = history.pop()
+                unmake_move(board, move, undo)
+            mismatches += int(not np.array_equal(board.accumulator.values, network.refresh(board).values))
+    output.write(f"{evaluations} positions, {mismatches} accumulator mismatches\n")
+    output.write(f"evaluate: {incremental_time / evaluations * 1e6:.1f} us per position, "
+                 f"accumulator refresh: {refresh_time / evaluations * 1e6:.1f} us per position\n")
+    return mismatches
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="NNUE network tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    init = commands.add_parser("init", help="write a randomly initialised network")
+    init.add_argument("network")
+    init.add_argument("--hidden", type=int, default=NNUE_HIDDEN)
+    init.add_argument("--layers", type=int, nargs="+", default=NNUE_LAYERS, help="dense layer sizes, the last one 1")
+    init.add_argument("--seed", type=int, default=0)
+    check = commands.add_parser("check", help="check incremental updates against full refreshes")
+    check.add_argument("network")
+    check.add_argument("fens", nargs="?", help="file with one FEN per line (default the bench positions)")
+    args = parser.parse_args(argv)
+
+    if args.command == "init":
+        save_network(args.network, *quantize_network(*random_network(args.hidden, args.layers, args.seed)))
+        print(f"network written to {args.network}")
+        return 0
+    network.load(args.network)
+    if args.fens:
+        with open(args.fens) as fen_file:
+            fens = [line.strip() for line in fen_file if line.strip()]
+    else:
+        fens = BENCH_POSITIONS
+    return 1 if check_network(fens) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
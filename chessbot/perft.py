@@ -0,0 +1,78 @@
+import sys
+import time
+import argparse
+
+from chessbot.board import STARTING_FEN, Board, load_position_from_fen, make_move, unmake_move
+from chessbot.movegen import generate_moves, move_to_uci
+
+# Standard perft positions with their known node counts for depth 1, 2, 3, ...
+PERFT_POSITIONS = [
+    ("startpos", STARTING_FEN, [20, 400, 8902, 197281, 4865609]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", [48, 2039, 97862, 4085603]),
+    ("position3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", [14, 191, 2812, 43238, 674624]),
+    ("position4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", [6, 264, 9467, 422333]),
+    ("position4 mirrored", "r2q1rk1/pP1p2pp/Q4n2/bbp1p3/Np6/1B3NBn/pPPP1PPP/R3K2R b KQ - 0 1", [6, 264, 9467, 422333]),
+    ("position5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", [44, 1486, 62379, 2103487]),
+    ("position6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10", [46, 2079, 89890, 3894594]),
+]
+
+def perft(board, depth):
+    # Leaf nodes are counted straight from the move list, since every generated move is legal
+    moves = generate_moves(board, board.turn)
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        undo = make_move(board, move)
+        nodes += perft(board, depth - 1)
+        unmake_move(board, move, undo)
+    return nodes
+
+def divide(board, depth):
+    # Node count below each root move, for tracking a wrong total down to the move that causes it
+    counts = {}
+    for move in generate_moves(board, board.turn):
+        undo = make_move(board, move)
+        counts[move] = perft(board, depth - 1)
+        unmake_move(board, move, undo)
+    return counts
+
+def run_perft_suite(max_depth, output=sys.stdout):
+    # Returns True when every count matches
+    passed = True
+    total_nodes = 0
+    total_time = 0.0
+    for name, fen, expected_counts in PERFT_POSITIONS:
+        board = Board()
+        load_position_from_fen(fen, board)
+        for depth, expected in enumerate(expected_counts[:max_depth], 1):
+            start = time.perf_counter()
+            nodes = perft(board, depth)
+            elapsed = time.perf_counter() - start
+            total_nodes += nodes
+            total_time += elapsed
+            status = "OK" if nodes == expected else "FAIL"
+            passed = passed and nodes == expected
+            output.write(f"{name:<20} depth {depth}  nodes {nodes:>10}  expected {expected:>10}  "
+                         f"{nodes / elapsed if elapsed > 0 else 0:>10.0f} nps  {status}\n")
+    output.write(f"Total: {total_nodes} nodes in {total_time:.2f}s, {total_nodes / total_time if total_time > 0 else 0:.0f} nps, "
+                 f"{'all counts match' if passed else 'MISMATCH'}\n")
+    return passed
+
+def main():
+    parser = argparse.ArgumentParser(description="Check move generation against known perft counts")
+    parser.add_argument("--depth", type=int, default=3, help="deepest perft to run for each position")
+    parser.add_argument("--divide", metavar="FEN", help="print the per-move node counts for this position instead")
+    args = parser.parse_args()
+    if args.divide:
+        board = Board()
+        load_position_from_fen(args.divide, board)
+        counts = divide(board, args.depth)
+        for move, nodes in counts.items():
+            print(f"{move_to_uci(move)}: {nodes}")
+        print(f"\nNodes searched: {sum(counts.values())}")
+        return
+    sys.exit(0 if run_perft_suite(args.depth) else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+AI_COLOR_LIGHT = 1
+AI_COLOR_DARK = -1
+
+class Piece():
+    Empty = 0
+    King = 1
+    Pawn = 2
+    Knight = 3
+    Bishop = 4
+    Rook = 5
+    Queen = 6
+    Light = 8
+    Dark = 16
+    TypeMask = 7
+    ColorMask = Light | Dark
+
+PIECES = [piece_type | color for color in (Piece.Light, Piece.Dark) for piece_type in range(Piece.King, Piece.Queen + 1)]
+PROMOTION_PIECES = [Piece.Queen, Piece.Rook, Piece.Bishop, Piece.Knight]
+
+PIECE_VALUES = {
+    Piece.King: 0,
+    Piece.Queen: 900,
+    Piece.Rook: 500,
+    Piece.Bishop: 300,
+    Piece.Knight: 300,
+    Piece.Pawn: 100,
+}
+
+# Piece-square tables for positional evaluation, in centipawns
+# These tables give a bonus or penalty for placing a piece on a specific square
+# They are written from Light's point of view with rank 8 on the first row
+PIECE_SQUARE_TABLES = {
+    Piece.Pawn: [
+        0, 0, 0, 0, 0, 0, 0, 0,
+        500, 500, 500, -500, -500, 500, 500, 500,
+        100, 100, 200, 300, 300, 200, 100, 100,
+        50, 50, 100, 250, 250, 100, 50, 50,
+        0, 0, 0, 200, 200, 0, 0, 0,
+        50, -50, -100, 0, 0, -100, -50, 50,
+        50, 100, 100, -200, -200, 100, 100, 50,
+        0, 0, 0, 0, 0, 0, 0, 0,
+    ],
+    Piece.Knight: [
+        -500, -400, -300, -300, -300, -300, -400, -500,
+        -400, -200, 0, 0, 0, 0, -200, -400,
+        -300, 0, 100, 150, 150, 100, 0, -300,
+        -300, 50, 150, 200, 200, 150, 50, -300,
+        -300, 0, 150, 200, 200, 150, 0, -300,
+        -300, 50, 100, 150, 150, 100, 50, -300,
+        -400, -200, 0, 50, 50, 0, -200, -400,
+        -500, -400, -300, -300, -300, -300, -400, -500,
+    ],
+    Piece.Bishop: [
+        -200, -100, -100, -100, -100, -100, -100, -200,
+        -100, 0, 0, 0, 0, 0, 0, -100,
+        -100, 0, 50, 100, 100, 50, 0, -100,
+        -100, 50, 50, 100, 100, 50, 50, -100,
+        -100, 0, 100, 100, 100, 100, 0, -100,
+        -100, 100, 100, 100, 100, 100, 100, -100,
+        -100, 50, 0, 0, 0, 0, 50, -100,
+        -200, -100, -100, -100, -100, -100, -100, -200,
+    ],
+    Piece.Rook: [
+        0, 0, 0, 0, 0, 0, 0, 0,
+        50, 100, 100, 100, 100, 100, 100, 50,
+        -50, 0, 0, 0, 0, 0, 0, -50,
+        -50, 0, 0, 0, 0, 0, 0, -50,
+        -50, 0, 0, 0, 0, 0, 0, -50,
+        -50, 0, 0, 0, 0, 0, 0, -50,
+        -50, 0, 0, 0, 0, 0, 0, -50,
+        0, 0, 0, 50, 50, 0, 0, 0,
+    ],
+    Piece.Queen: [
+        -200, -100, -100, -50, -50, -100, -100, -200,
+        -100, 0, 0, 0, 0, 0, 0, -100,
+        -100, 0, 50, 50, 50, 50, 0, -100,
+        -50, 0, 50, 50, 50, 50, 0, -50,
+        0, 0, 50, 50, 50, 50, 0, -50,
+        -100, 50, 50, 50, 50, 50, 0, -100,
+        -100, 0, 50, 0, 0, 0, 0, -100,
+        -200, -100, -100, -50, -50, -100, -100, -200,
+    ],
+    Piece.King: [
+        -300, -400, -400, -500, -500, -400, -400, -300,
+        -300, -400, -400, -500, -500, -400, -400, -300,
+        -300, -400, -400, -500, -500, -400, -400, -300,
+        -300, -400, -400, -500, -500, -400, -400, -300,
+        -200, -300, -300, -400, -400, -300, -300, -200,
+        -100, -200, -200, -200, -200, -200, -200, -100,
+        200, 200, 0, 0, 0, 0, 200, 200,
+        200, 300, 100, 0, 0, 100, 300, 200,
+    ],
+}
+
+# Endgame tables; pieces without one use their middlegame table
+ENDGAME_PIECE_SQUARE_TABLES = {
+    Piece.King: [
+        -500, -400, -300, -200, -200, -300, -400, -500,
+        -300, -200, -100, 0, 0, -100, -200, -300,
+        -300, -100, 200, 300, 300, 200, -100, -300,
+        -300, -100, 300, 400, 400, 300, -100, -300,
+        -300, -100, 300, 400, 400, 300, -100, -300,
+        -300, -100, 200, 300, 300, 200, -100, -300,
+        -300, -300, 0, 0, 0, 0, -300, -300,
+        -500, -300, -300, -300, -300, -300, -300, -500,
+    ],
+}
+
+# Game phase runs from 24 with all minor and major pieces on the board down to 0 with none
+PHASE_WEIGHTS = {
+    Piece.King: 0,
+    Piece.Queen: 4,
+    Piece.Rook: 2,
+    Piece.Bishop: 1,
+    Piece.Knight: 1,
+    Piece.Pawn: 0,
+}
+MAX_PHASE = 24
+
+# Material values the evaluation uses; a tuned parameter file replaces these, while move ordering, exchange
+# evaluation and the tablebase names keep PIECE_VALUES
+evaluation_piece_values = dict(PIECE_VALUES)
+
+# Material plus piece-square value of every piece on every square, signed from Light's point of view
+middlegame_tables = {piece: [0] * 64 for piece in PIECES}
+endgame_tables = {piece: [0] * 64 for piece in PIECES}
+phase_weights = {piece: PHASE_WEIGHTS[piece & Piece.TypeMask] for piece in PIECES}
+
+def precompute_evaluation_tables():
+    for piece in PIECES:
+        piece_type = piece & Piece.TypeMask
+        middlegame = PIECE_SQUARE_TABLES[piece_type]
+        endgame = ENDGAME_PIECE_SQUARE_TABLES.get(piece_type, middlegame)
+        for square in range(64):
+            if piece & Piece.Light:
+                # The tables list rank 8 first, so Light pieces read them vertically flipped
+                index = square ^ 56
+                sign = AI_COLOR_LIGHT
+            else:
+                index = square
+                sign = AI_COLOR_DARK
+            middlegame_tables[piece][square] = sign * (evaluation_piece_values[piece_type] + middlegame[index])
+            endgame_tables[piece][square] = sign * (evaluation_piece_values[piece_type] + endgame[index])
+
+
+precompute_evaluation_tables()
@@ -0,0 +1,819 @@
+import io
+import os
+import math
+import time
+import logging
+import cProfile
+import pstats
+import threading
+import multiprocessing
+import multiprocessing.util
+from multiprocessing import shared_memory
+
+from chessbot.pieces import Piece, AI_COLOR_LIGHT, AI_COLOR_DARK, PIECE_VALUES
+from chessbot.bitboards import bishop_attacks, rook_attacks
+from chessbot.board import find_king, make_move, unmake_move
+from chessbot.movegen import attackers_to, is_square_attacked, generate_moves, move_to_uci
+from chessbot import evaluation
+from chessbot.evaluation import evaluate_board, pawn_hash_table, load_evaluation_parameters
+from chessbot.tablebase import TB_WIN_SCORE, TB_MAX_DISTANCE, tablebases
+from chessbot.nnue import network
+
+# Values used when trading pieces off on one square; the king can never be captured so it outweighs everything
+SEE_PIECE_VALUES = {**PIECE_VALUES, Piece.King: 20000}
+# Largest positional swing a capture is assumed to cause on top of the material it wins
+DELTA_MARGIN = 200
+
+def static_exchange_evaluation(board, move):
+    # Material balance of the capture sequence on the target square, each side always recapturing with its least valuable piece
+    from_index, to_index = move[0], move[1]
+    bitboards = board.bitboards
+    occupied = board.occupancy[Piece.Light] | board.occupancy[Piece.Dark]
+    piece = board.squares[from_index]
+    target = board.squares[to_index]
+    if target is None:
+        # En passant; the captured pawn sits behind the target square
+        target = Piece.Pawn
+        occupied ^= 1 << (to_index - 8 if piece & Piece.Light else to_index + 8)
+    diagonal = bitboards[Piece.Bishop | Piece.Light] | bitboards[Piece.Bishop | Piece.Dark] | bitboards[Piece.Queen | Piece.Light] | bitboards[Piece.Queen | Piece.Dark]
+    straight = bitboards[Piece.Rook | Piece.Light] | bitboards[Piece.Rook | Piece.Dark] | bitboards[Piece.Queen | Piece.Light] | bitboards[Piece.Queen | Piece.Dark]
+    attackers = attackers_to(board, to_index, Piece.Light, occupied) | attackers_to(board, to_index, Piece.Dark, occupied)
+
+    gain = [SEE_PIECE_VALUES[target & Piece.TypeMask]]
+    attacker = 1 << from_index
+    attacker_value = SEE_PIECE_VALUES[piece & Piece.TypeMask]
+    color = piece & Piece.ColorMask
+    while attacker:
+        gain.append(attacker_value - gain[-1])
+        if max(-gain[-2], gain[-1]) < 0:
+            break
+        occupied ^= attacker
+        # Removing a piece can uncover a slider behind it
+        attackers |= (bishop_attacks(to_index, occupied) & diagonal) | (rook_attacks(to_index, occupied) & straight)
+        attackers &= occupied
+        color = Piece.Dark if color == Piece.Light else Piece.Light
+        attacker = 0
+        for piece_type in [Piece.Pawn, Piece.Knight, Piece.Bishop, Piece.Rook, Piece.Queen, Piece.King]:
+            candidates = attackers & bitboards[piece_type | color]
+            if candidates:
+                attacker = candidates & -candidates
+                attacker_value = SEE_PIECE_VALUES[piece_type]
+                break
+    # The last entry is a capture nobody could make, so it takes no part in the result
+    for depth in range(len(gain) - 2, 0, -1):
+        gain[depth - 1] = -max(-gain[depth - 1], gain[depth])
+    return gain[0]
+
+def quiescence_search(board, alpha, beta, color, ply):
+    controller = search_controller
+    controller.nodes += 1
+    if controller.nodes >= controller.next_poll:
+        controller.poll()
+    stats = controller.stats
+    stats.quiescence_nodes += 1
+    enemy_color = Piece.Dark if board.turn == Piece.Light else Piece.Light
+    if is_square_attacked(board, find_king(board, board.turn), enemy_color):
+        # No standing pat while in check: every evasion has to be tried
+        moves = get_all_moves(board, board.turn)
+        if not moves:
+            return -(MATE_SCORE - ply)
+        stand_pat = None
+    else:
+        stats.evaluations += 1
+        stand_pat = color * evaluate_board(board)
+        if stand_pat >= beta:
+            return beta
+        if stand_pat > alpha:
+            alpha = stand_pat
+        moves = generate_moves(board, board.turn, quiets=False)
+        moves.sort(key=lambda move: get_move_priority(board, (move[0], move[1])), reverse=True)
+
+    for move in moves:
+        if stand_pat is not None:
+            target = board.squares[move[1]]
+            gain = PIECE_VALUES[target & Piece.TypeMask] if target else PIECE_VALUES[Piece.Pawn]
+            if len(move) > 2:
+                gain += PIECE_VALUES[move[2]] - PIECE_VALUES[Piece.Pawn]
+            # Delta pruning: even winning the piece outright would not lift the score to alpha
+            elif stand_pat + gain + DELTA_MARGIN <= alpha:
+                continue
+            # Skip captures that lose material once the exchange on the square is played out
+            if len(move) == 2 and static_exchange_evaluation(board, move) < 0:
+                continue
+        undo = make_move(board, move)
+        score = -quiescence_search(board, -beta, -alpha, -color, ply + 1)
+        unmake_move(board, move, undo)
+        if score >= beta:
+            return beta
+        if score > alpha:
+            alpha = score
+    return alpha
+
+
+TT_EXACT = 1
+TT_LOWER = 2
+TT_UPPER = 3
+TT_SIZE_MB = 16
+# The root's search window is infinite, which a packed integer field cannot hold
+TT_SCORE_INFINITE = (1 << 31) - 1
+# Being mated n plies from the root scores -(MATE_SCORE - n), so shorter mates are preferred
+MATE_SCORE = 30000
+
+def encode_move(move):
+    if move is None:
+        return 0
+    return move[0] | (move[1] << 6) | ((move[2] if len(move) > 2 else 0) << 12)
+
+def decode_move(code):
+    if not code:
+        return None
+    if code >> 12:
+        return (code & 63, (code >> 6) & 63, code >> 12)
+    return (code & 63, (code >> 6) & 63)
+
+def encode_score(score):
+    if score == math.inf:
+        return TT_SCORE_INFINITE
+    if score == -math.inf:
+        return -TT_SCORE_INFINITE
+    return int(score)
+
+def decode_score(value):
+    if value == TT_SCORE_INFINITE:
+        return math.inf
+    if value == -TT_SCORE_INFINITE:
+        return -math.inf
+    return value
+
+def is_mate_score(score):
+    return abs(score) >= MATE_SCORE - MAX_PLY
+
+def is_distance_score(score):
+    # Mates and tablebase wins both count down by the plies from the root
+    return abs(score) >= TB_WIN_SCORE - TB_MAX_DISTANCE - MAX_PLY and not math.isinf(score)
+
+def score_to_tt(score, ply):
+    # Such scores are stored as the distance from this node, not from the root, so they hold wherever the position is reached again
+    if is_distance_score(score):
+        return score + ply if score > 0 else score - ply
+    return score
+
+def score_from_tt(score, ply):
+    if is_distance_score(score):
+        return score - ply if score > 0 else score + ply
+    return score
+
+class TranspositionTable():
+    # Each entry is two 64-bit words: the key XORed with the data, then the data itself.
+    # Data bits: move (0-15), depth (16-23), bound and age (24-31), score (32-63).
+    # A torn write from another process leaves a word pair whose XOR no longer gives the key, so it reads as a miss.
+    ENTRY_SIZE = 16
+
+    def __init__(self, size_mb=TT_SIZE_MB, buffer=None):
+        self.resize(size_mb, buffer)
+
+    @staticmethod
+    def buffer_size(size_mb):
+        # Entries come in buckets of two: a depth-preferred slot and an always-replace slot
+        return max(1, size_mb * 1024 * 1024 // (2 * TranspositionTable.ENTRY_SIZE)) * 2 * TranspositionTable.ENTRY_SIZE
+
+    def resize(self, size_mb, buffer=None):
+        # The buffer may be shared memory attached by several processes; otherwise the table owns its own
+        self.size_mb = size_mb
+        size = self.buffer_size(size_mb)
+        self.num_buckets = size // (2 * self.ENTRY_SIZE)
+        if buffer is None:
+            buffer = bytearray(size)
+        self.data = memoryview(buffer)[:size]
+        self.words = self.data.cast('Q')
+        self.age = 0
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.collisions = 0
+
+    def release(self):
+        # Shared memory cannot be closed while views into it are still alive
+        self.words.release()
+        self.data.release()
+
+    def clear(self):
+        self.data[:] = bytes(len(self.data))
+        self.age = 0
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.collisions = 0
+
+    def new_search(self):
+        self.age = (self.age + 1) & 63
+
+    def probe(self, key):
+        self.probes += 1
+        words = self.words
+        index = (key % self.num_buckets) * 4
+        for slot in (index, index + 2):
+            data = words[slot + 1]
+            if data and words[slot] ^ data == key:
+                self.hits += 1
+                depth = (data >> 16) & 0xFF
+                if depth > 127:
+                    depth -= 256
+                return depth, decode_score((data >> 32) - (1 << 31)), (data >> 24) & 3, decode_move(data & 0xFFFF)
+        return None
+
+    def store(self, key, depth, score, bound, move):
+        words = self.words
+        index = (key % self.num_buckets) * 4
+        data = words[index + 1]
+        stored_depth = (data >> 16) & 0xFF
+        if stored_depth > 127:
+            stored_depth -= 256
+        if not data or words[index] ^ data == key or depth >= stored_depth or (data >> 26) & 63 != self.age:
+            slot = index
+        else:
+            slot = index + 2
+        data = words[slot + 1]
+        if data and words[slot] ^ data != key:
+            self.collisions += 1
+        elif move is None and data:
+            # Keep the best move found by an earlier search of the same position
+            move = decode_move(data & 0xFFFF)
+        self.stores += 1
+        data = (encode_move(move)
+                | ((depth & 0xFF) << 16)
+                | ((bound | (self.age << 2)) << 24)
+                | ((encode_score(score) + (1 << 31)) << 32))
+        words[slot + 1] = data
+        words[slot] = key ^ data
+
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+transposition_table = TranspositionTable()
+
+def negamax(board, depth, alpha, beta, color, ply=1):
+    controller = search_controller
+    controller.nodes += 1
+    if controller.nodes >= controller.next_poll:
+        controller.poll()
+    stats = controller.stats
+    if tablebases.max_pieces and (board.occupancy[Piece.Light] | board.occupancy[Piece.Dark]).bit_count() <= tablebases.max_pieces:
+        score = tablebases.probe_score(board, ply)
+        if score is not None:
+            stats.tablebase_hits += 1
+            return score
+    alpha_original = alpha
+    tt_move = None
+    stats.tt_probes += 1
+    entry = transposition_table.probe(board.zobrist_key)
+    if entry is not None:
+        stats.tt_hits += 1
+        tt_depth, tt_score, tt_bound, tt_move = entry
+        tt_score = score_from_tt(tt_score, ply)
+        if tt_depth >= depth:
+            if (tt_bound == TT_EXACT
+                    or (tt_bound == TT_LOWER and tt_score >= beta)
+                    or (tt_bound == TT_UPPER and tt_score <= alpha)):
+                stats.tt_cutoffs += 1
+                return tt_score
+
+    if depth == 0:
+        return quiescence_search(board, alpha, beta, color, ply)
+
+    max_value = -math.inf
+    best_move = None
+    searched = 0
+    for move in pick_moves(board, tt_move, ply):
+        searched += 1
+        undo = make_move(board, move)
+        child_color = -color
+        value = -negamax(board, depth - 1, -beta, -alpha, child_color, ply + 1)
+        unmake_move(board, move, undo)
+        if value > max_value:
+            max_value = value
+            best_move = move
+        alpha = max(alpha, value)
+        if alpha >= beta:
+            stats.beta_cutoffs += 1
+            if searched == 1:
+                stats.first_move_cutoffs += 1
+            record_cutoff(board, move, depth, ply)
+            break
+
+    if not searched:
+        # Check for checkmate or stalemate
+        if is_square_attacked(board, find_king(board, board.turn), Piece.Dark if board.turn == Piece.Light else Piece.Light):
+            return -(MATE_SCORE - ply)  # Checkmate
+        else:
+            return 0  # Stalemate
+
+    if max_value <= alpha_original:
+        bound = TT_UPPER
+    elif max_value >= beta:
+        bound = TT_LOWER
+    else:
+        bound = TT_EXACT
+    transposition_table.store(board.zobrist_key, depth, score_to_tt(max_value, ply), bound, best_move)
+    return max_value
+
+# Ordering scores: hash move, then captures and promotions, then killers, then quiets by history
+TT_MOVE_SCORE = 1 << 30
+CAPTURE_SCORE = 1 << 20
+KILLER_SCORES = ((1 << 19) + 1, 1 << 19)
+HISTORY_MAX = 1 << 18
+MAX_PLY = 64
+
+mvv_lva = [0] * 64
+killer_moves = [[None, None] for _ in range(MAX_PLY)]
+history_table = [0] * 4096
+
+def precompute_move_ordering_tables():
+    # Most valuable victim first, least valuable attacker breaking ties
+    attacker_order = [Piece.Pawn, Piece.Knight, Piece.Bishop, Piece.Rook, Piece.Queen, Piece.King]
+    for victim in range(Piece.King, Piece.Queen + 1):
+        for rank, attacker in enumerate(attacker_order):
+            mvv_lva[victim * 8 + attacker] = PIECE_VALUES[victim] * 8 - rank
+
+def get_move_priority(board, move):
+    piece_type = board.squares[move[0]] & Piece.TypeMask
+    target_piece = board.squares[move[1]]
+    if target_piece:
+        priority = mvv_lva[(target_piece & Piece.TypeMask) * 8 + piece_type]
+    elif piece_type == Piece.Pawn and move[1] == board.en_passant_target:
+        priority = mvv_lva[Piece.Pawn * 8 + Piece.Pawn]
+    else:
+        priority = 0
+    if len(move) > 2:
+        priority += PIECE_VALUES[move[2]] * 8
+    return priority
+
+def order_moves(board, moves, tt_move, ply):
+    killers = killer_moves[ply] if ply < MAX_PLY else (None, None)
+    scores = {}
+    for move in moves:
+        if move == tt_move:
+            scores[move] = TT_MOVE_SCORE
+            continue
+        priority = get_move_priority(board, move)
+        if priority or len(move) > 2:
+            scores[move] = CAPTURE_SCORE + priority
+        elif move == killers[0]:
+            scores[move] = KILLER_SCORES[0]
+        elif move == killers[1]:
+            scores[move] = KILLER_SCORES[1]
+        else:
+            scores[move] = history_table[move[0] * 64 + move[1]]
+    moves.sort(key=scores.__getitem__, reverse=True)
+    return moves
+
+def pick_moves(board, tt_move, ply):
+    # Moves are generated in stages so a cutoff on an early move skips generating the rest
+    color = board.turn
+    if tt_move is not None and tt_move in generate_moves(board, color, from_mask=1 << tt_move[0]):
+        yield tt_move
+
+    captures = generate_moves(board, color, quiets=False)
+    captures.sort(key=lambda move: get_move_priority(board, move), reverse=True)
+    for move in captures:
+        if move != tt_move:
+            yield move
+
+    # A killer from a sibling node still has to be a legal quiet move here
+    killers = [killer for killer in killer_moves[ply] if killer is not None and killer != tt_move] if ply < MAX_PLY else []
+    for killer in killers:
+        if board.squares[killer[1]] is None and killer in generate_moves(board, color, from_mask=1 << killer[0], captures=False):
+            yield killer
+
+    quiets = generate_moves(board, color, captures=False)
+    quiets.sort(key=lambda move: history_table[move[0] * 64 + move[1]], reverse=True)
+    for move in quiets:
+        if move != tt_move and move not in killers:
+            yield move
+
+def record_cutoff(board, move, depth, ply):
+    # Only quiet moves are remembered; captures are already ordered well by MVV/LVA
+    if get_move_priority(board, move):
+        return
+    if ply < MAX_PLY:
+        killers = killer_moves[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+    index = move[0] * 64 + move[1]
+    history_table[index] += depth * depth
+    if history_table[index] > HISTORY_MAX:
+        for i in range(4096):
+            history_table[i] //= 2
+
+def new_search_ordering():
+    # Killers belong to the previous position, history is only worth half as much
+    for killers in killer_moves:
+        killers[0] = killers[1] = None
+    for i in range(4096):
+        history_table[i] //= 2
+
+def clear_move_ordering():
+    # Forget everything learned from earlier games, so a search depends only on its own position
+    for killers in killer_moves:
+        killers[0] = killers[1] = None
+    for i in range(4096):
+        history_table[i] = 0
+
+
+def get_all_moves(board, color):
+    all_moves = generate_moves(board, color)
+    # Assign priority based on MVV/LVA
+    all_moves.sort(key=lambda move: get_move_priority(board, (move[0], move[1])), reverse=True)
+    return all_moves
+
+# Nodes searched between looks at the clock and the stop flag
+NODE_POLL_INTERVAL = 64
+# Assumed ratio between the time of one iteration and the next, used to skip iterations that cannot finish
+ITERATION_TIME_FACTOR = 4
+
+# Functions listed when a profiled search is summarised
+PROFILE_LINES = 25
+
+logger = logging.getLogger(__name__)
+
+class SearchAborted(Exception):
+    pass
+
+class SearchStats():
+    # Counters filled in while a search runs; nodes covers both the main search and quiescence
+    def __init__(self):
+        self.nodes = 0
+        self.quiescence_nodes = 0
+        self.evaluations = 0
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.tt_cutoffs = 0
+        self.beta_cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.tablebase_hits = 0
+        self.time = 0.0
+        self.iterations = []  # one dict per completed depth: depth, nodes, time, value, move
+        self.profile = None
+
+    def tt_hit_rate(self):
+        return self.tt_hits / self.tt_probes if self.tt_probes else 0.0
+
+    def first_move_cutoff_rate(self):
+        # Share of beta cutoffs caused by the first move searched; close to 1 means move ordering is doing its job
+        return self.first_move_cutoffs / self.beta_cutoffs if self.beta_cutoffs else 0.0
+
+    def branching_factor(self):
+        # Effective branching factor: nodes of the last iteration over nodes of the one before
+        if len(self.iterations) < 2:
+            return None
+        previous = self.iterations[-2]["nodes"] - (self.iterations[-3]["nodes"] if len(self.iterations) > 2 else 0)
+        last = self.iterations[-1]["nodes"] - self.iterations[-2]["nodes"]
+        return last / previous if previous else None
+
+    def as_dict(self):
+        return {
+            "nodes": self.nodes,
+            "quiescence_nodes": self.quiescence_nodes,
+            "evaluations": self.evaluations,
+            "tt_probes": self.tt_probes,
+            "tt_hits": self.tt_hits,
+            "tt_cutoffs": self.tt_cutoffs,
+            "tt_hit_rate": round(self.tt_hit_rate(), 4),
+            "beta_cutoffs": self.beta_cutoffs,
+            "first_move_cutoff_rate": round(self.first_move_cutoff_rate(), 4),
+            "tablebase_hits": self.tablebase_hits,
+            "branching_factor": round(self.branching_factor(), 2) if self.branching_factor() else None,
+            "time": round(self.time, 4),
+            "nps": int(self.nodes / self.time) if self.time > 0 else 0,
+            "iterations": self.iterations,
+        }
+
+    def summary(self):
+        branching_factor = self.branching_factor()
+        return (f"{self.nodes} nodes ({self.quiescence_nodes} quiescence) in {self.time:.2f}s, "
+                f"{int(self.nodes / self.time) if self.time > 0 else 0} nps, {self.evaluations} evaluations, "
+                f"TT hits {self.tt_hit_rate():.1%} with {self.tt_cutoffs} cutoffs, "
+                f"first-move cutoffs {self.first_move_cutoff_rate():.1%}, "
+                f"branching factor {f'{branching_factor:.2f}' if branching_factor else 'n/a'}")
+
+class SearchController():
+    # Decides when a search stops: depth, node count, soft and hard deadlines, or an external stop flag
+    def __init__(self, max_depth=MAX_PLY, time_limit=None, soft_time=None, nodes=None, stop_event=None, profile=False):
+        self.start_time = time.time()
+        self.max_depth = min(max_depth, MAX_PLY)
+        self.hard_deadline = self.start_time + time_limit if time_limit is not None else None
+        self.soft_deadline = self.start_time + soft_time if soft_time is not None else None
+        self.node_limit = nodes
+        self.stop_event = stop_event
+        self.nodes = 0
+        self.next_poll = NODE_POLL_INTERVAL if nodes is None else min(NODE_POLL_INTERVAL, nodes)
+        self.stopped = False
+        self.stop_requested = False
+        self.completed_depth = 0
+        self.profile = profile
+        self.stats = SearchStats()
+
+    def poll(self):
+        self.next_poll = self.nodes + NODE_POLL_INTERVAL
+        if self.node_limit is not None:
+            self.next_poll = min(self.next_poll, self.node_limit)
+        if self.should_stop():
+            self.stopped = True
+            raise SearchAborted()
+
+    def stop(self):
+        # Safe to call from another thread; the search notices at its next poll
+        self.stop_requested = True
+
+    def ponderhit(self, max_depth, time_limit, soft_time=None, nodes=None):
+        # The pondered position has come up on the board: from now on the search runs to normal limits,
+        # with time and nodes counted from the hit
+        now = time.time()
+        self.max_depth = min(max_depth, MAX_PLY)
+        self.hard_deadline = now + time_limit if time_limit is not None else None
+        self.soft_deadline = now + soft_time if soft_time is not None else None
+        if nodes is not None:
+            self.node_limit = self.nodes + nodes
+            self.next_poll = min(self.next_poll, self.node_limit)
+        if self.completed_depth >= self.max_depth:
+            self.stop()
+
+    def should_stop(self):
+        if self.stop_requested:
+            return True
+        if self.hard_deadline is not None and time.time() >= self.hard_deadline:
+            return True
+        if self.node_limit is not None and self.nodes >= self.node_limit:
+            return True
+        return self.stop_event is not None and self.stop_event.is_set()
+
+    def start_next_iteration(self, last_iteration_time):
+        if self.stopped or self.should_stop():
+            return False
+        now = time.time()
+        if self.soft_deadline is not None and now >= self.soft_deadline:
+            return False
+        # An iteration that will be cut off by the hard deadline only wastes the remaining time
+        if self.hard_deadline is not None and now + last_iteration_time * ITERATION_TIME_FACTOR > self.hard_deadline:
+            return False
+        return True
+
+    def elapsed(self):
+        return time.time() - self.start_time
+
+search_controller = SearchController()
+
+def choose_best_move(board, max_depth, time_limit, nodes=None, soft_time=None, on_stats=None, profile=False):
+    # on_stats(stats) receives the SearchStats of the finished search
+    transposition_table.new_search()
+    controller = SearchController(max_depth, time_limit, soft_time, nodes, profile=profile)
+    best_move, best_value, depth = iterative_deepening(board, controller)
+    stats = controller.stats
+    logger.info("Searched %s", stats.summary())
+    logger.info("Table hit rates: TT %.1f%% (lifetime), %d collisions, pawn hash %.1f%%",
+                transposition_table.hit_rate() * 100, transposition_table.collisions, pawn_hash_table.hit_rate() * 100)
+    if stats.profile:
+        logger.info("Profile:\n%s", stats.profile)
+    if on_stats is not None:
+        on_stats(stats)
+    return best_move
+
+def iterative_deepening(board, controller, start_depth=1, verbose=True, on_iteration=None):
+    # Returns the best move, its value and the last depth searched to completion.
+    # on_iteration(board, depth, value, move) is called after every completed iteration
+    global search_controller
+    search_controller = controller
+    # An aborted search leaves its moves on the board, so it works on a copy
+    board = board.clone()
+    if controller.profile:
+        profiler = cProfile.Profile()
+        result = profiler.runcall(search_iterations, board, controller, start_depth, verbose, on_iteration)
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats("tottime").print_stats(PROFILE_LINES)
+        controller.stats.profile = output.getvalue()
+    else:
+        result = search_iterations(board, controller, start_depth, verbose, on_iteration)
+    controller.stats.nodes = controller.nodes
+    controller.stats.time = controller.elapsed()
+    return result
+
+def search_iterations(board, controller, start_depth, verbose, on_iteration):
+    best_move = None
+    best_value = -math.inf
+    completed_depth = 0
+    
+    # Map board.turn to AI color
+    if board.turn == Piece.Dark:
+        ai_color = AI_COLOR_DARK
+    elif board.turn == Piece.Light:
+        ai_color = AI_COLOR_LIGHT
+    else:
+        ai_color = AI_COLOR_LIGHT  # Default to Light if undefined
+    new_search_ordering()
+
+    moves = generate_moves(board, board.turn)
+    # Endings covered by the tablebases are played straight from them
+    root = tablebases.best_move(board) if tablebases.max_pieces else None
+    if root is not None:
+        best_move, best_value = root
+        controller.completed_depth = 1
+        if verbose:
+            logger.info("Tablebase move %s, value %s", move_to_uci(best_move), best_value)
+        if on_iteration is not None:
+            on_iteration(board, 1, best_value, best_move)
+        return best_move, best_value, 1
+    last_iteration_time = 0.0
+    # max_depth is read every iteration because a ponder hit can lower it mid-search
+    for depth in range(start_depth, MAX_PLY + 1):
+        if depth > controller.max_depth:
+            break
+        if depth > start_depth and not controller.start_next_iteration(last_iteration_time):
+            break
+        iteration_start = time.time()
+        current_best_move = None
+        current_best_value = -math.inf
+        alpha = -math.inf
+        beta = math.inf
+
+        # Start from the best move of the previous iteration
+        order_moves(board, moves, best_move, 0)
+        if verbose:
+            logger.debug("Searching depth %d", depth)
+        try:
+            for move in moves:
+                undo = make_move(board, move)
+                value = -negamax(board, depth - 1, -beta, -alpha, -ai_color)
+                unmake_move(board, move, undo)
+                if value > current_best_value:
+                    current_best_value = value
+                    current_best_move = move
+                alpha = max(alpha, value)
+                if alpha >= beta:
+                    break
+        except SearchAborted:
+            if verbose:
+                logger.info("Search stopped during depth %d", depth)
+            # The previous best move is searched first, so any root move that finished already improves on it or confirms it
+            if current_best_move:
+                best_move = current_best_move
+                best_value = current_best_value
+            break
+        if current_best_move:
+            best_move = current_best_move
+            best_value = current_best_value
+            completed_depth = depth
+            controller.completed_depth = depth
+            controller.stats.iterations.append({"depth": depth, "nodes": controller.nodes, "time": round(controller.elapsed(), 4),
+                                                "value": best_value if best_value not in (math.inf, -math.inf) else str(best_value),
+                                                "move": move_to_uci(best_move)})
+            transposition_table.store(board.zobrist_key, depth, best_value, TT_EXACT, best_move)
+            if on_iteration is not None:
+                on_iteration(board, depth, best_value, best_move)
+        last_iteration_time = time.time() - iteration_start
+        if verbose:
+            logger.info("Depth %d: best move %s, value %s, %d nodes, %.2fs", depth, move_to_uci(best_move) if best_move else None,
+                        best_value, controller.nodes, controller.elapsed())
+        # A forced mate found at this depth will not change with a deeper search
+        if is_mate_score(best_value):
+            break
+    if best_move is None and moves:
+        # Stopped before a single root move was searched; any legal move beats none
+        best_move = moves[0]
+    return best_move, best_value, completed_depth
+
+def principal_variation(board, max_length=MAX_PLY):
+    # Follows the best moves stored in the transposition table from this position
+    board = board.clone()
+    line = []
+    seen = set()
+    while len(line) < max_length and board.zobrist_key not in seen:
+        seen.add(board.zobrist_key)
+        entry = transposition_table.probe(board.zobrist_key)
+        if entry is None or entry[3] is None:
+            break
+        move = entry[3]
+        if move not in generate_moves(board, board.turn, from_mask=1 << move[0]):
+            break
+        line.append(move)
+        make_move(board, move)
+    return line
+
+def predict_reply(board):
+    # The opponent's expected reply is the best move the last search stored for the position after our move
+    entry = transposition_table.probe(board.zobrist_key)
+    if entry is None or entry[3] is None:
+        return None
+    move = entry[3]
+    if move in generate_moves(board, board.turn, from_mask=1 << move[0]):
+        return move
+    return None
+
+class PonderSearch():
+    # Searches the position after the predicted reply on the opponent's time, with no limits until ponderhit
+    def __init__(self, board, predicted_move):
+        self.predicted_move = predicted_move
+        self.board = board.clone()
+        make_move(self.board, predicted_move)
+        self.controller = SearchController()
+        self.result = (None, -math.inf, 0)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        transposition_table.new_search()
+        self.thread.start()
+
+    def run(self):
+        self.result = iterative_deepening(self.board, self.controller, verbose=False)
+
+    def ponderhit(self, max_depth, time_limit, soft_time=None, nodes=None):
+        self.controller.ponderhit(max_depth, time_limit, soft_time, nodes)
+        self.thread.join()
+        logger.info("Ponder hit: depth %d after %.2fs", self.result[2], self.controller.elapsed())
+        return self.result[0]
+
+    def stop(self):
+        # A miss throws the search away, but what it stored in the transposition table is kept
+        self.controller.stop()
+        self.thread.join()
+
+def start_pondering(board):
+    predicted_move = predict_reply(board)
+    if predicted_move is None:
+        return None
+    return PonderSearch(board, predicted_move)
+
+# Lazy SMP: every process searches the same root and they cooperate only through the shared transposition table
+SEARCH_PROCESSES = os.cpu_count() or 1
+
+worker_shared_memory = None
+worker_stop_event = None
+
+def init_search_worker(shared_memory_name, size_mb, stop_event, tablebase_directory, evaluation_parameters_path, network_path):
+    global transposition_table, worker_shared_memory, worker_stop_event
+    worker_shared_memory = shared_memory.SharedMemory(name=shared_memory_name)
+    transposition_table = TranspositionTable(size_mb, worker_shared_memory.buf)
+    worker_stop_event = stop_event
+    if tablebase_directory is not None:
+        tablebases.load(tablebase_directory)
+    if evaluation_parameters_path is not None:
+        load_evaluation_parameters(evaluation_parameters_path)
+    if network_path is not None:
+        network.load(network_path)
+    multiprocessing.util.Finalize(None, close_search_worker, exitpriority=10)
+
+def close_search_worker():
+    tablebases.close()
+    transposition_table.release()
+    worker_shared_memory.close()
+
+def search_worker(board, max_depth, time_limit, nodes, soft_time, worker_id, age):
+    transposition_table.age = age
+    controller = SearchController(max_depth, time_limit, soft_time, nodes, worker_stop_event)
+    # Odd helpers start a ply deeper so the processes do not walk the same tree in lockstep
+    return iterative_deepening(board, controller, start_depth=min(1 + worker_id % 2, max_depth), verbose=worker_id == 0)
+
+class LazySMPSearch():
+    def __init__(self, processes=SEARCH_PROCESSES, size_mb=TT_SIZE_MB):
+        global transposition_table
+        # Spawned rather than forked so the workers do not inherit the pygame window
+        context = multiprocessing.get_context("spawn")
+        self.processes = processes
+        self.shared_memory = shared_memory.SharedMemory(create=True, size=TranspositionTable.buffer_size(size_mb))
+        self.transposition_table = TranspositionTable(size_mb, self.shared_memory.buf)
+        # Searches in this process use the shared table too: predict_reply finds the workers' moves, and what
+        # a ponder search stores while the workers are idle is there for them afterwards
+        self.process_table = transposition_table
+        transposition_table = self.transposition_table
+        self.stop_event = context.Event()
+        # Workers open whatever tablebases, evaluation parameters and network this process has loaded by now
+        self.pool = context.Pool(processes, initializer=init_search_worker,
+                                 initargs=(self.shared_memory.name, size_mb, self.stop_event, tablebases.directory,
+                                           evaluation.evaluation_parameters_path, network.path))
+
+    def choose_best_move(self, board, max_depth, time_limit, nodes=None, soft_time=None):
+        self.transposition_table.new_search()
+        self.stop_event.clear()
+        # The first process to finish stops the others at their next node poll
+        results = [self.pool.apply_async(search_worker, (board, max_depth, time_limit, nodes, soft_time, worker_id, self.transposition_table.age),
+                                         callback=lambda result: self.stop_event.set())
+                   for worker_id in range(self.processes)]
+        best_move, best_value, best_depth = None, -math.inf, 0
+        for result in results:
+            move, value, depth = result.get()
+            if move is not None and (best_move is None or depth > best_depth):
+                best_move, best_value, best_depth = move, value, depth
+        logger.info("Lazy SMP: %d processes, deepest completed depth %d, value %s", self.processes, best_depth, best_value)
+        return best_move
+
+    def close(self):
+        global transposition_table
+        # Let a search still in progress wind down so the thread waiting on it is not left hanging
+        self.stop_event.set()
+        self.pool.close()
+        self.pool.join()
+        transposition_table = self.process_table
+        self.transposition_table.release()
+        self.shared_memory.close()
+        self.shared_memory.unlink()
+
+
+precompute_move_ordering_tables()
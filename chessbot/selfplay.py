@@ -0,0 +1,125 @@
+import os
+import sys
+import math
+import time
+import random
+import argparse
+import multiprocessing
+
+from chessbot.pieces import Piece
+from chessbot.board import Board, load_position_from_fen, board_to_fen, make_move
+from chessbot.movegen import generate_moves
+from chessbot.search import MAX_PLY, SearchController, iterative_deepening, clear_move_ordering
+from chessbot import search
+from chessbot.tablebase import TB_WIN_SCORE, TB_MAX_DISTANCE
+from chessbot.match import MATCH_OPENINGS, adjudicate
+from chessbot.tune import is_quiet
+from chessbot import evaluation
+from chessbot.evaluation import EVAL_PARAMS_PATH, load_evaluation_parameters
+from chessbot.nnue import NNUE_PATH, network
+
+# Training data for the network: the engine plays itself on a small node budget and every quiet position
+# is written as "fen | result | score", with the game's result and the search score both from Light's point
+# of view. The result comes first so chessbot.tune reads the same files.
+
+SELFPLAY_GAMES = 100
+SELFPLAY_NODES = 5000
+SELFPLAY_PROCESSES = os.cpu_count() or 1
+# Random moves played after the opening so games do not repeat each other
+SELFPLAY_RANDOM_PLIES = 8
+# Scores this large are mates or tablebase wins, which say little about the evaluation
+SELFPLAY_SCORE_LIMIT = TB_WIN_SCORE - TB_MAX_DISTANCE - MAX_PLY
+RESULT_VALUES = {"1-0": 1.0, "1/2-1/2": 0.5, "0-1": 0.0}
+
+def init_selfplay_worker(evaluation_parameters_path, network_path):
+    if evaluation_parameters_path is not None:
+        load_evaluation_parameters(evaluation_parameters_path)
+    if network_path is not None:
+        network.load(network_path)
+
+def play_selfplay_game(index, depth=MAX_PLY, nodes=SELFPLAY_NODES, random_plies=SELFPLAY_RANDOM_PLIES, seed=0):
+    # Returns the game's result and its (fen, score) records
+    rng = random.Random(seed * 1000003 + index)
+    board = Board()
+    load_position_from_fen(MATCH_OPENINGS[index % len(MATCH_OPENINGS)], board)
+    for _ in range(random_plies):
+        moves = generate_moves(board, board.turn)
+        if not moves:
+            break
+        make_move(board, rng.choice(moves))
+    # Every game starts from empty tables, like a new game over UCI
+    search.transposition_table.clear()
+    clear_move_ordering()
+    key_counts = {board.zobrist_key: 1}
+    records = []
+    plies = 0
+    while True:
+        outcome = adjudicate(board, key_counts, plies)
+        if outcome is not None:
+            return RESULT_VALUES[outcome[0]], records
+        controller = SearchController(depth, nodes=nodes)
+        move, value, completed_depth = iterative_deepening(board, controller, verbose=False)
+        # Only quiet positions: the score of a position in check or in the middle of an exchange
+        # depends on the search more than on the position
+        en_passant = move[1] == board.en_passant_target and board.squares[move[0]] & Piece.TypeMask == Piece.Pawn
+        capture = board.squares[move[1]] is not None or en_passant
+        quiet = is_quiet(board) and not capture and len(move) == 2
+        if quiet and not math.isinf(value) and abs(value) < SELFPLAY_SCORE_LIMIT:
+            score = int(value) if board.turn == Piece.Light else -int(value)
+            records.append((board_to_fen(board), score))
+        make_move(board, move)
+        key_counts[board.zobrist_key] = key_counts.get(board.zobrist_key, 0) + 1
+        plies += 1
+
+def play_selfplay_games(games, depth=MAX_PLY, nodes=SELFPLAY_NODES, processes=SELFPLAY_PROCESSES,
+                        random_plies=SELFPLAY_RANDOM_PLIES, seed=0):
+    # Yields (result, records) as games finish
+    arguments = [(index, depth, nodes, random_plies, seed) for index in range(games)]
+    if processes <= 1:
+        for game in arguments:
+            yield play_selfplay_game(*game)
+        return
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(processes, initializer=init_selfplay_worker,
+                      initargs=(evaluation.evaluation_parameters_path, network.path)) as pool:
+        for game in pool.imap_unordered(play_selfplay_game_arguments, arguments):
+            yield game
+
+def play_selfplay_game_arguments(arguments):
+    return play_selfplay_game(*arguments)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write self-play positions as training data for the network")
+    parser.add_argument("output", help="file to append positions to")
+    parser.add_argument("--games", type=int, default=SELFPLAY_GAMES)
+    parser.add_argument("--depth", type=int, default=MAX_PLY, help="search depth per move (default unlimited)")
+    parser.add_argument("--nodes", type=int, default=SELFPLAY_NODES, help="node budget per move")
+    parser.add_argument("--processes", type=int, default=SELFPLAY_PROCESSES)
+    parser.add_argument("--random-plies", type=int, default=SELFPLAY_RANDOM_PLIES)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--network", help=f"network to play with (default {NNUE_PATH} when it exists)")
+    args = parser.parse_args(argv)
+    if os.path.exists(EVAL_PARAMS_PATH):
+        load_evaluation_parameters(EVAL_PARAMS_PATH)
+    if args.network:
+        network.load(args.network)
+    elif os.path.exists(NNUE_PATH):
+        network.load(NNUE_PATH)
+
+    start = time.perf_counter()
+    positions = 0
+    scores = [0, 0, 0]
+    with open(args.output, "a") as output:
+        for played, (result, records) in enumerate(play_selfplay_games(args.games, args.depth, args.nodes, args.processes,
+                                                                       args.random_plies, args.seed), 1):
+            for fen, score in records:
+                output.write(f"{fen} | {result} | {score}\n")
+            output.flush()
+            positions += len(records)
+            scores[int(result * 2)] += 1
+            sys.stderr.write(f"game {played}/{args.games}: {positions} positions, "
+                             f"+{scores[2]} ={scores[1]} -{scores[0]}, {time.perf_counter() - start:.0f}s\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
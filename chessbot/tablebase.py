@@ -0,0 +1,472 @@
+import os
+import sys
+import mmap
+import time
+import argparse
+from itertools import product
+
+from chessbot.pieces import Piece, PIECE_VALUES
+from chessbot.bitboards import knight_attacks, king_attacks, pawn_attacks, bishop_attacks, rook_attacks
+from chessbot.board import Board, load_position_from_fen, make_move, unmake_move
+from chessbot.movegen import generate_moves, move_to_uci
+
+# Endgame tablebases built by retrograde analysis. Every table covers one material signature such as KQvKR,
+# with White holding the stronger side, and stores one byte per position: 0 for a draw, otherwise the
+# distance to mate in plies plus one. Odd distances are wins for the side to move, even ones losses.
+# The white king is kept on files a-d by mirroring, which halves the table; castling never occurs and
+# en passant captures are not considered.
+
+TB_DIRECTORY = "tablebases"
+TB_EXTENSION = ".tb"
+TB_MAX_PIECES = 4
+# Scores for won tablebase positions: above any evaluation, below the score of a mate on the board
+TB_WIN_SCORE = 20000
+TB_MAX_DISTANCE = 254
+TB_PIECE_ORDER = [Piece.King, Piece.Queen, Piece.Rook, Piece.Bishop, Piece.Knight, Piece.Pawn]
+TB_LETTERS = {Piece.King: 'K', Piece.Queen: 'Q', Piece.Rook: 'R', Piece.Bishop: 'B', Piece.Knight: 'N', Piece.Pawn: 'P'}
+TB_PIECE_TYPES = {letter: piece_type for piece_type, letter in TB_LETTERS.items()}
+# Endings that cannot be won by either side and need no table
+TB_TRIVIAL_DRAWS = {"KvK", "KBvK", "KNvK"}
+TB_PROMOTIONS = [Piece.Queen, Piece.Rook, Piece.Bishop, Piece.Knight]
+# Signatures generated when no list is given on the command line
+TB_DEFAULT_SIGNATURES = ["KQvK", "KRvK", "KPvK", "KQvKR", "KRvKB", "KRvKN", "KBNvK", "KBBvK"]
+
+UNRESOLVED = 1
+RESOLVED = 2
+
+def side_strength(letters):
+    return (len(letters), sorted((PIECE_VALUES[TB_PIECE_TYPES[letter]] for letter in letters), reverse=True))
+
+def normalize_signature(signature):
+    # The side with more (then heavier) pieces is stored as White
+    white, black = signature.upper().split('V')
+    order = lambda letter: TB_PIECE_ORDER.index(TB_PIECE_TYPES[letter])
+    white, black = "".join(sorted(white, key=order)), "".join(sorted(black, key=order))
+    if side_strength(black) > side_strength(white):
+        white, black = black, white
+    return white + 'v' + black
+
+def signature_pieces(signature):
+    white, black = signature.split('v')
+    return [TB_PIECE_TYPES[letter] | Piece.Light for letter in white] + [TB_PIECE_TYPES[letter] | Piece.Dark for letter in black]
+
+def table_size(signature):
+    return 2 * 32 * 64 ** (len(signature) - 2)
+
+def table_index(squares, side):
+    # side is 0 with White to move and 1 with Black to move; squares[0] is the white king
+    if squares[0] & 7 > 3:
+        squares = [square ^ 7 for square in squares]
+    index = side * 32 + (squares[0] >> 3) * 4 + (squares[0] & 7)
+    for square in squares[1:]:
+        index = index * 64 + square
+    return index
+
+def decode_index(index, count):
+    squares = []
+    for _ in range(count - 1):
+        squares.append(index & 63)
+        index >>= 6
+    king = index & 31
+    squares.append((king >> 2) * 8 + (king & 3))
+    squares.reverse()
+    return squares, index >> 5
+
+def canonical_position(pieces, squares, side):
+    # Returns the signature of the table holding the position and its index there
+    order = lambda entry: TB_PIECE_ORDER.index(entry[0] & Piece.TypeMask)
+    white = sorted([entry for entry in zip(pieces, squares) if entry[0] & Piece.Light], key=order)
+    black = sorted([entry for entry in zip(pieces, squares) if entry[0] & Piece.Dark], key=order)
+    white_letters = "".join(TB_LETTERS[piece & Piece.TypeMask] for piece, square in white)
+    black_letters = "".join(TB_LETTERS[piece & Piece.TypeMask] for piece, square in black)
+    if side_strength(black_letters) > side_strength(white_letters):
+        # Swap the colours by flipping the board vertically
+        white, black = [(piece, square ^ 56) for piece, square in black], [(piece, square ^ 56) for piece, square in white]
+        white_letters, black_letters = black_letters, white_letters
+        side ^= 1
+    signature = white_letters + 'v' + black_letters
+    return signature, table_index([square for piece, square in white + black], side)
+
+def decode_value(value):
+    # Returns (outcome, distance) for the side to move: outcome is 1 for a win, 0 for a draw and -1 for a loss
+    if value == 0:
+        return 0, None
+    distance = value - 1
+    return (1 if distance % 2 else -1), distance
+
+def piece_attacks(piece, square, occupied):
+    piece_type = piece & Piece.TypeMask
+    if piece_type == Piece.Knight:
+        return knight_attacks[square]
+    if piece_type == Piece.King:
+        return king_attacks[square]
+    if piece_type == Piece.Bishop:
+        return bishop_attacks(square, occupied)
+    if piece_type == Piece.Rook:
+        return rook_attacks(square, occupied)
+    if piece_type == Piece.Queen:
+        return bishop_attacks(square, occupied) | rook_attacks(square, occupied)
+    return pawn_attacks[piece & (Piece.Light | Piece.Dark)][square]
+
+def is_attacked(pieces, squares, target, by_color, occupied, skip=None):
+    for slot, piece in enumerate(pieces):
+        if slot != skip and piece & by_color and piece_attacks(piece, squares[slot], occupied) >> target & 1:
+            return True
+    return False
+
+def slot_moves(pieces, squares, side):
+    # Yields (slot, to_square, captured_slot, promotion) for every legal move of the side to move
+    color = Piece.Light if side == 0 else Piece.Dark
+    enemy = Piece.Dark if side == 0 else Piece.Light
+    occupied = 0
+    own = 0
+    for slot, square in enumerate(squares):
+        occupied |= 1 << square
+        if pieces[slot] & color:
+            own |= 1 << square
+    king_slot = pieces.index(Piece.King | color)
+    for slot, piece in enumerate(pieces):
+        if not piece & color:
+            continue
+        from_square = squares[slot]
+        if piece & Piece.TypeMask == Piece.Pawn:
+            step = 8 if color == Piece.Light else -8
+            targets = pawn_attacks[color][from_square] & occupied & ~own
+            if not occupied >> (from_square + step) & 1:
+                targets |= 1 << (from_square + step)
+                start_rank = 1 if color == Piece.Light else 6
+                if from_square >> 3 == start_rank and not occupied >> (from_square + 2 * step) & 1:
+                    targets |= 1 << (from_square + 2 * step)
+        else:
+            targets = piece_attacks(piece, from_square, occupied) & ~own
+        while targets:
+            to_square = (targets & -targets).bit_length() - 1
+            targets &= targets - 1
+            captured = None
+            if occupied >> to_square & 1:
+                captured = squares.index(to_square)
+            new_occupied = (occupied & ~(1 << from_square)) | 1 << to_square
+            new_squares = list(squares)
+            new_squares[slot] = to_square
+            if is_attacked(pieces, new_squares, new_squares[king_slot], enemy, new_occupied, captured):
+                continue
+            if piece & Piece.TypeMask == Piece.Pawn and to_square >> 3 in (0, 7):
+                for promotion in TB_PROMOTIONS:
+                    yield slot, to_square, captured, promotion
+            else:
+                yield slot, to_square, captured, None
+
+def is_legal_position(pieces, squares, side):
+    if len(set(squares)) != len(squares):
+        return False
+    kings = [squares[slot] for slot, piece in enumerate(pieces) if piece & Piece.TypeMask == Piece.King]
+    if king_attacks[kings[0]] >> kings[1] & 1:
+        return False
+    for slot, piece in enumerate(pieces):
+        if piece & Piece.TypeMask == Piece.Pawn and squares[slot] >> 3 in (0, 7):
+            return False
+    # The side that just moved cannot have left its king in check
+    waiting = Piece.Dark if side == 0 else Piece.Light
+    occupied = 0
+    for square in squares:
+        occupied |= 1 << square
+    king = squares[pieces.index(Piece.King | waiting)]
+    return not is_attacked(pieces, squares, king, Piece.Light if side == 0 else Piece.Dark, occupied)
+
+def exit_signatures(signature):
+    # Tables reached by captures and promotions
+    pieces = signature_pieces(signature)
+    found = set()
+    variants = [pieces]
+    for slot, piece in enumerate(pieces):
+        if piece & Piece.TypeMask == Piece.Pawn:
+            variants += [pieces[:slot] + [promotion | (piece & ~Piece.TypeMask)] + pieces[slot + 1:] for promotion in TB_PROMOTIONS]
+    for variant in variants:
+        for slot, piece in enumerate(variant):
+            if piece & Piece.TypeMask != Piece.King:
+                remaining = variant[:slot] + variant[slot + 1:]
+                found.add(canonical_position(remaining, [0] * len(remaining), 0)[0])
+        if variant is not pieces:
+            found.add(canonical_position(variant, [0] * len(variant), 0)[0])
+    found.discard(signature)
+    return found
+
+def lookup(tables, pieces, squares, side):
+    signature, index = canonical_position(pieces, squares, side)
+    if signature in TB_TRIVIAL_DRAWS:
+        return 0
+    return tables[signature][index]
+
+def unmove_sources(piece, square, occupied):
+    # Squares the piece could have come from with a quiet move
+    if piece & Piece.TypeMask != Piece.Pawn:
+        return piece_attacks(piece, square, occupied) & ~occupied
+    step = -8 if piece & Piece.Light else 8
+    start_rank = 1 if piece & Piece.Light else 6
+    sources = 0
+    previous = square + step
+    if previous >> 3 != (0 if piece & Piece.Light else 7) and not occupied >> previous & 1:
+        sources |= 1 << previous
+        if (previous + step) >> 3 == start_rank and not occupied >> (previous + step) & 1:
+            sources |= 1 << (previous + step)
+    return sources
+
+def predecessors(pieces, squares, side):
+    # Canonical indices of the positions one quiet move before this one, once per move. A move into the
+    # mirror image of the position comes back here as the mirrored move from the mirrored predecessor.
+    mover = Piece.Dark if side == 0 else Piece.Light
+    occupied = 0
+    for square in squares:
+        occupied |= 1 << square
+    for slot, piece in enumerate(pieces):
+        if not piece & mover:
+            continue
+        sources = unmove_sources(piece, squares[slot], occupied)
+        while sources:
+            source = (sources & -sources).bit_length() - 1
+            sources &= sources - 1
+            previous = list(squares)
+            previous[slot] = source
+            yield table_index(previous, side ^ 1)
+
+def generate_table(signature, tables, verbose=True):
+    pieces = signature_pieces(signature)
+    count = len(pieces)
+    size = table_size(signature)
+    result = bytearray(size)
+    state = bytearray(size)
+    remaining = bytearray(size)
+    exit_loss = bytearray(size)
+    exit_draw = bytearray(size)
+    exit_win = bytearray(size)
+    buckets = {}
+    start = time.time()
+
+    # First pass: legality, quiet move counts, mates and the values of captures and promotions
+    king_squares = [rank * 8 + file for rank in range(8) for file in range(4)]
+    index = 0
+    for side in (0, 1):
+        for squares in product(king_squares, *[range(64)] * (count - 1)):
+            if not is_legal_position(pieces, squares, side):
+                index += 1
+                continue
+            state[index] = UNRESOLVED
+            moves = 0
+            for slot, to_square, captured, promotion in slot_moves(pieces, squares, side):
+                moves += 1
+                if captured is None and promotion is None:
+                    remaining[index] += 1
+                    continue
+                child_pieces = list(pieces)
+                child_squares = list(squares)
+                child_squares[slot] = to_square
+                if promotion is not None:
+                    child_pieces[slot] = promotion | (pieces[slot] & ~Piece.TypeMask)
+                if captured is not None:
+                    del child_pieces[captured], child_squares[captured]
+                outcome, distance = decode_value(lookup(tables, child_pieces, child_squares, side ^ 1))
+                if outcome < 0:
+                    exit_win[index] = 1
+                    buckets.setdefault(distance + 1, []).append(index)
+                elif outcome == 0:
+                    exit_draw[index] = 1
+                else:
+                    exit_loss[index] = max(exit_loss[index], distance + 1)
+            if not moves:
+                mover_king = squares[pieces.index(Piece.King | (Piece.Light if side == 0 else Piece.Dark))]
+                occupied = sum(1 << square for square in squares)
+                if is_attacked(pieces, squares, mover_king, Piece.Dark if side == 0 else Piece.Light, occupied):
+                    buckets.setdefault(0, []).append(index)
+                else:
+                    state[index] = RESOLVED  # stalemate
+            elif not remaining[index] and not exit_win[index] and not exit_draw[index]:
+                buckets.setdefault(exit_loss[index], []).append(index)
+            index += 1
+    if verbose:
+        print(f"{signature}: {size} positions scanned in {time.time() - start:.1f}s", flush=True)
+
+    # Retrograde pass: resolve positions in order of distance to mate
+    distance = 0
+    while buckets and distance <= TB_MAX_DISTANCE:
+        resolved = []
+        for index in buckets.pop(distance, []):
+            if state[index] == UNRESOLVED:
+                state[index] = RESOLVED
+                result[index] = distance + 1
+                resolved.append(index)
+        for index in resolved:
+            squares, side = decode_index(index, count)
+            for previous in predecessors(pieces, squares, side):
+                if state[previous] != UNRESOLVED:
+                    continue
+                if distance % 2 == 0:
+                    # The position is lost for the side to move, so moving into it wins
+                    buckets.setdefault(distance + 1, []).append(previous)
+                else:
+                    remaining[previous] -= 1
+                    if not remaining[previous] and not exit_win[previous] and not exit_draw[previous]:
+                        buckets.setdefault(max(distance + 1, exit_loss[previous]), []).append(previous)
+        distance += 1
+    if verbose:
+        decided = sum(1 for value in result if value)
+        print(f"{signature}: {decided} decided positions, longest mate {distance - 1} plies, {time.time() - start:.1f}s", flush=True)
+    return result
+
+def table_path(directory, signature):
+    return os.path.join(directory, signature + TB_EXTENSION)
+
+def generate_tables(signatures, directory=TB_DIRECTORY, verbose=True):
+    # Generates the tables and every table they convert into, skipping files that already exist
+    os.makedirs(directory, exist_ok=True)
+    tables = {}
+
+    def ensure(signature):
+        if signature in tables or signature in TB_TRIVIAL_DRAWS:
+            return
+        path = table_path(directory, signature)
+        if os.path.exists(path):
+            with open(path, "rb") as table_file:
+                tables[signature] = table_file.read()
+            return
+        for dependency in sorted(exit_signatures(signature)):
+            ensure(dependency)
+        tables[signature] = generate_table(signature, tables, verbose)
+        with open(path, "wb") as table_file:
+            table_file.write(tables[signature])
+
+    for signature in signatures:
+        ensure(normalize_signature(signature))
+    return sorted(tables)
+
+class Tablebases():
+    # Memory-mapped tables for probing during search; empty until load is called
+    def __init__(self):
+        self.directory = None
+        self.files = []
+        self.tables = {}
+        self.max_pieces = 0
+
+    def load(self, directory):
+        self.close()
+        self.directory = directory
+        for name in sorted(os.listdir(directory)):
+            signature, extension = os.path.splitext(name)
+            if extension != TB_EXTENSION:
+                continue
+            table_file = open(os.path.join(directory, name), "rb")
+            if os.fstat(table_file.fileno()).st_size != table_size(signature):
+                table_file.close()
+                continue
+            self.files.append(table_file)
+            self.tables[signature] = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.max_pieces = max(self.max_pieces, len(signature) - 1)
+        return len(self.tables)
+
+    def close(self):
+        for table in self.tables.values():
+            table.close()
+        for table_file in self.files:
+            table_file.close()
+        self.directory = None
+        self.files = []
+        self.tables = {}
+        self.max_pieces = 0
+
+    def probe(self, board):
+        # Returns (outcome, distance) for the side to move, or None if the position is not covered
+        occupied = board.occupancy[Piece.Light] | board.occupancy[Piece.Dark]
+        if occupied.bit_count() > self.max_pieces or board.castling_rights:
+            return None
+        if board.en_passant_target is not None:
+            pawns = board.bitboards[Piece.Pawn | board.turn]
+            if pawn_attacks[Piece.Dark if board.turn == Piece.Light else Piece.Light][board.en_passant_target] & pawns:
+                return None
+        pieces = []
+        squares = []
+        for square, piece in enumerate(board.squares):
+            if piece is not None:
+                pieces.append(piece)
+                squares.append(square)
+        signature, index = canonical_position(pieces, squares, 0 if board.turn == Piece.Light else 1)
+        if signature in TB_TRIVIAL_DRAWS:
+            return 0, None
+        table = self.tables.get(signature)
+        if table is None:
+            return None
+        return decode_value(table[index])
+
+    def probe_score(self, board, ply=0):
+        # Tablebase result as a search score for the side to move, counting the mate from ply moves back
+        entry = self.probe(board)
+        if entry is None:
+            return None
+        outcome, distance = entry
+        if outcome == 0:
+            return 0
+        return outcome * (TB_WIN_SCORE - distance - ply)
+
+    def best_move(self, board):
+        # Returns (move, score) keeping a win, holding a draw or resisting longest, or None if a move is not covered
+        root = self.probe(board)
+        if root is None:
+            return None
+        best = None
+        for move in generate_moves(board, board.turn):
+            undo = make_move(board, move)
+            entry = self.probe(board)
+            if entry is None:
+                # A mate on the board is not in the tables only when no pieces are left to deliver it
+                unmake_move(board, move, undo)
+                return None
+            outcome, distance = entry
+            # Rank from the mover's side: quick wins first, then draws, then the slowest losses
+            if outcome < 0:
+                rank = (2, -distance)
+            elif outcome == 0:
+                rank = (1, 0)
+            else:
+                rank = (0, distance)
+            unmake_move(board, move, undo)
+            if best is None or rank > best[0]:
+                best = (rank, move)
+        if best is None:
+            return None
+        outcome, distance = root
+        return best[1], 0 if outcome == 0 else outcome * (TB_WIN_SCORE - distance)
+
+tablebases = Tablebases()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Retrograde endgame tablebases")
+    commands = parser.add_subparsers(dest="command", required=True)
+    generate = commands.add_parser("generate", help="generate tables, with the tables they convert into")
+    generate.add_argument("signatures", nargs="*", default=TB_DEFAULT_SIGNATURES, help="material such as KQvK or KRvKN")
+    generate.add_argument("--directory", default=TB_DIRECTORY)
+    probe = commands.add_parser("probe", help="look up a position and its best move")
+    probe.add_argument("fen")
+    probe.add_argument("--directory", default=TB_DIRECTORY)
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        for signature in args.signatures:
+            if len(signature) - 1 > TB_MAX_PIECES:
+                parser.error(f"{signature}: at most {TB_MAX_PIECES} pieces are supported")
+        written = generate_tables(args.signatures, args.directory)
+        print(f"Tables in {args.directory}: {', '.join(written)}")
+        return 0
+    tablebases.load(args.directory)
+    board = Board()
+    load_position_from_fen(args.fen, board)
+    entry = tablebases.probe(board)
+    if entry is None:
+        print("Position not covered")
+        return 1
+    outcome, distance = entry
+    print({1: f"Win, mate in {distance} plies", 0: "Draw", -1: f"Loss, mated in {distance} plies"}[outcome])
+    best = tablebases.best_move(board)
+    if best is not None:
+        print(f"Best move {move_to_uci(best[0])}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,278 @@
+import sys
+import math
+import argparse
+
+import numpy as np
+
+from chessbot.pieces import Piece, PIECES, MAX_PHASE, ENDGAME_PIECE_SQUARE_TABLES, phase_weights
+from chessbot.board import STARTING_FEN, Board, load_position_from_fen, board_to_fen, find_king, make_move
+from chessbot.movegen import is_square_attacked, parse_san
+from chessbot.book import PGN_RESULTS, read_pgn_games
+from chessbot.batch_eval import BATCH_SIZE, encode_boards, to_planes, to_bitboards, pawn_structure_counts, mobility_counts, king_safety_counts
+from chessbot.evaluation import (EVAL_PARAMS_PATH, PIECE_NAMES, evaluation_parameters, load_evaluation_parameters,
+                                 save_evaluation_parameters)
+
+# Texel tuning: fit the evaluation so that sigmoid(eval) predicts the game result of every labelled position.
+# Every parameter enters evaluate_board linearly once the game phase is known, so the evaluation of a whole
+# dataset is one matrix product and the gradient of the error another.
+
+TUNE_ITERATIONS = 1000
+LEARNING_RATE = 2.0
+# Opening moves of a PGN game say little about its result
+PGN_SKIP_PLIES = 8
+RESULT_LABELS = {"1-0": 1.0, "0-1": 0.0, "1/2-1/2": 0.5}
+# Order of the piece types within the parameter vector
+TUNED_TYPES = [Piece.Pawn, Piece.Knight, Piece.Bishop, Piece.Rook, Piece.Queen, Piece.King]
+# The king is always on the board for both sides, so its value cancels out and is not tuned
+VALUE_TYPES = [Piece.Pawn, Piece.Knight, Piece.Bishop, Piece.Rook, Piece.Queen]
+# Adam step parameters
+ADAM_BETA1 = 0.9
+ADAM_BETA2 = 0.999
+ADAM_EPSILON = 1e-8
+
+# Rows of to_planes for each piece type of each side
+light_rows = [PIECES.index(piece_type | Piece.Light) for piece_type in TUNED_TYPES]
+dark_rows = [PIECES.index(piece_type | Piece.Dark) for piece_type in TUNED_TYPES]
+# The tables list rank 8 first, so Light pieces read them vertically flipped
+flipped_squares = np.arange(64) ^ 56
+phase_by_code = np.zeros(32, dtype=np.int64)
+
+def precompute_tuning_tables():
+    for piece in PIECES:
+        phase_by_code[piece] = phase_weights[piece]
+
+def parse_label(tokens):
+    # The result after the position fields, as "1-0", "1.0", "[0.5]", 'c9 "1/2-1/2";' and the like
+    for token in tokens:
+        token = token.strip('[]();|,"\'')
+        if token in RESULT_LABELS:
+            return RESULT_LABELS[token]
+        try:
+            value = float(token)
+        except ValueError:
+            continue
+        # Other EPD operations carry numbers too, such as "acd 20;"
+        if 0 <= value <= 1:
+            return value
+    return None
+
+def read_labeled_fens(path):
+    # One position per line followed by the result from Light's point of view; unlabelled lines are skipped
+    with open(path) as fen_file:
+        for line in fen_file:
+            fields = line.split()
+            if len(fields) < 5 or fields[0].startswith('#'):
+                continue
+            rest = fields[4:]
+            # Halfmove clock and fullmove number, when present, come before the result
+            if len(rest) >= 2 and rest[0].isdigit() and rest[1].isdigit():
+                rest = rest[2:]
+            result = parse_label(rest)
+            if result is not None:
+                yield " ".join(fields[:4]), result
+
+def read_labeled_games(path, skip_plies=PGN_SKIP_PLIES):
+    # Every position of every finished game, labelled with the game's result
+    for tags, sans in read_pgn_games(path):
+        result = tags.get("Result", "*")
+        if result not in PGN_RESULTS:
+            continue
+        board = Board()
+        load_position_from_fen(tags.get("FEN", STARTING_FEN), board)
+        for ply, san in enumerate(sans):
+            move = parse_san(board, san)
+            if move is None:
+                break
+            if ply >= skip_plies:
+                yield board_to_fen(board), RESULT_LABELS[result]
+            make_move(board, move)
+
+def read_labeled_positions(path):
+    return read_labeled_games(path) if path.lower().endswith(".pgn") else read_labeled_fens(path)
+
+def is_quiet(board):
+    # The static evaluation says little about a side in check, so such positions are left out
+    king = find_king(board, board.turn)
+    enemy = Piece.Dark if board.turn == Piece.Light else Piece.Light
+    return king is not None and find_king(board, enemy) is not None and not is_square_attacked(board, king, enemy)
+
+class TuningSet():
+    def __init__(self, positions):
+        boards = []
+        results = []
+        chunks = []
+        for fen, result in positions:
+            board = Board()
+            load_position_from_fen(fen, board)
+            if not is_quiet(board):
+                continue
+            boards.append(board)
+            results.append(result)
+            if len(boards) == BATCH_SIZE:
+                chunks.append(self.encode(boards))
+                boards = []
+        if boards:
+            chunks.append(self.encode(boards))
+        if not chunks:
+            raise ValueError("no labelled positions")
+        # squares[n, type, index] is how many more Light than Dark pieces of TUNED_TYPES[type] read entry
+        # index of their piece-square table: -1, 0 or 1
+        self.squares = np.concatenate([chunk[0] for chunk in chunks])
+        self.phase = np.concatenate([chunk[1] for chunk in chunks])
+        # Light minus Dark pawn structure count, king safety count, and mobility per TUNED_TYPES
+        self.terms = np.concatenate([chunk[2] for chunk in chunks])
+        self.results = np.array(results, dtype=np.float64)
+
+    def encode(self, boards):
+        encoded = encode_boards(boards)
+        planes = to_planes(encoded)
+        squares = planes[:, light_rows][:, :, flipped_squares] - planes[:, dark_rows]
+        phase = np.minimum(phase_by_code[encoded].sum(axis=1), MAX_PHASE)
+        bitboards = to_bitboards(encoded)
+        pawn_structure = pawn_structure_counts(bitboards)
+        king_safety = king_safety_counts(bitboards)
+        mobility = mobility_counts(bitboards)
+        terms = [pawn_structure[0] - pawn_structure[1], king_safety[1] - king_safety[0]]
+        terms += [mobility[piece_type][0] - mobility[piece_type][1] for piece_type in TUNED_TYPES]
+        return squares, phase, np.stack(terms, axis=1)
+
+    def __len__(self):
+        return len(self.results)
+
+    def features(self, start, stop, endgame_types):
+        # One row per position, laid out like parameter_vector, so features @ vector is evaluate_board
+        squares = self.squares[start:stop].astype(np.float32)
+        middlegame = (self.phase[start:stop] / MAX_PHASE).astype(np.float32)[:, None]
+        columns = [squares[:, [TUNED_TYPES.index(piece_type) for piece_type in VALUE_TYPES]].sum(axis=2)]
+        # A piece without its own endgame table uses its middlegame table throughout
+        for type_index, piece_type in enumerate(TUNED_TYPES):
+            columns.append(squares[:, type_index] * middlegame if piece_type in endgame_types else squares[:, type_index])
+        for piece_type in endgame_types:
+            columns.append(squares[:, TUNED_TYPES.index(piece_type)] * (1 - middlegame))
+        columns.append(self.terms[start:stop].astype(np.float32))
+        return np.concatenate(columns, axis=1)
+
+def parameter_vector(parameters, endgame_types):
+    values = [parameters["piece_values"][PIECE_NAMES[piece_type]] for piece_type in VALUE_TYPES]
+    for piece_type in TUNED_TYPES:
+        values += parameters["middlegame_tables"][PIECE_NAMES[piece_type]]
+    for piece_type in endgame_types:
+        # A new endgame table starts out as a copy of the middlegame one
+        tables = parameters["endgame_tables"] if PIECE_NAMES[piece_type] in parameters["endgame_tables"] else parameters["middlegame_tables"]
+        values += tables[PIECE_NAMES[piece_type]]
+    values += [parameters["pawn_structure_weight"], parameters["king_safety_weight"]]
+    values += [parameters["mobility_weights"][PIECE_NAMES[piece_type]] for piece_type in TUNED_TYPES]
+    return np.array(values, dtype=np.float64)
+
+def vector_parameters(vector, endgame_types, king_value=0):
+    # The inverse of parameter_vector, rounded to the integers the engine uses
+    values = [int(round(value)) for value in vector]
+    position = len(VALUE_TYPES)
+    piece_values = {PIECE_NAMES[piece_type]: value for piece_type, value in zip(VALUE_TYPES, values)}
+    piece_values[PIECE_NAMES[Piece.King]] = king_value
+    middlegame_tables = {}
+    for piece_type in TUNED_TYPES:
+        middlegame_tables[PIECE_NAMES[piece_type]] = values[position:position + 64]
+        position += 64
+    endgame_tables = {}
+    for piece_type in endgame_types:
+        endgame_tables[PIECE_NAMES[piece_type]] = values[position:position + 64]
+        position += 64
+    return {
+        "piece_values": piece_values,
+        "middlegame_tables": middlegame_tables,
+        "endgame_tables": endgame_tables,
+        "pawn_structure_weight": values[position],
+        "king_safety_weight": values[position + 1],
+        "mobility_weights": {PIECE_NAMES[piece_type]: value for piece_type, value in zip(TUNED_TYPES, values[position + 2:])},
+    }
+
+def win_probability(scores, scaling):
+    return 1 / (1 + np.power(10, -scaling * scores / 400))
+
+def evaluate_dataset(dataset, vector, endgame_types):
+    scores = np.empty(len(dataset), dtype=np.float64)
+    for start in range(0, len(dataset), BATCH_SIZE):
+        scores[start:start + BATCH_SIZE] = dataset.features(start, start + BATCH_SIZE, endgame_types) @ vector.astype(np.float32)
+    return scores
+
+def mean_error(dataset, scores, scaling):
+    return float(np.mean((dataset.results - win_probability(scores, scaling)) ** 2))
+
+def fit_scaling(dataset, scores, low=-4.0, high=2.0, steps=60):
+    # Golden section search over log10 of the sigmoid scaling constant
+    ratio = (math.sqrt(5) - 1) / 2
+    for _ in range(steps):
+        left = high - ratio * (high - low)
+        right = low + ratio * (high - low)
+        if mean_error(dataset, scores, 10 ** left) < mean_error(dataset, scores, 10 ** right):
+            high = right
+        else:
+            low = left
+    return 10 ** ((low + high) / 2)
+
+def error_gradient(dataset, vector, endgame_types, scaling):
+    gradient = np.zeros(len(vector), dtype=np.float64)
+    error = 0.0
+    weights = vector.astype(np.float32)
+    for start in range(0, len(dataset), BATCH_SIZE):
+        features = dataset.features(start, start + BATCH_SIZE, endgame_types)
+        probability = win_probability((features @ weights).astype(np.float64), scaling)
+        difference = probability - dataset.results[start:start + BATCH_SIZE]
+        error += float((difference ** 2).sum())
+        # d/dscore of (probability - result) ** 2
+        slope = 2 * difference * probability * (1 - probability) * scaling * math.log(10) / 400
+        gradient += features.T.astype(np.float64) @ slope
+    return error / len(dataset), gradient / len(dataset)
+
+def tune(dataset, vector, endgame_types, scaling, iterations=TUNE_ITERATIONS, learning_rate=LEARNING_RATE, report=100, output=sys.stdout):
+    # Adam on the full dataset; every step moves each parameter by about learning_rate centipawns at most
+    vector = vector.copy()
+    first_moment = np.zeros_like(vector)
+    second_moment = np.zeros_like(vector)
+    for iteration in range(1, iterations + 1):
+        error, gradient = error_gradient(dataset, vector, endgame_types, scaling)
+        first_moment = ADAM_BETA1 * first_moment + (1 - ADAM_BETA1) * gradient
+        second_moment = ADAM_BETA2 * second_moment + (1 - ADAM_BETA2) * gradient ** 2
+        corrected_first = first_moment / (1 - ADAM_BETA1 ** iteration)
+        corrected_second = second_moment / (1 - ADAM_BETA2 ** iteration)
+        vector -= learning_rate * corrected_first / (np.sqrt(corrected_second) + ADAM_EPSILON)
+        if report and (iteration % report == 0 or iteration == 1):
+            output.write(f"iteration {iteration}: error {error:.6f}\n")
+            output.flush()
+    return vector
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tune the evaluation parameters on positions labelled with game results")
+    parser.add_argument("data", help="FEN/EPD file with a result after every position, or a PGN file")
+    parser.add_argument("--output", default=EVAL_PARAMS_PATH, help=f"parameter file to write (default {EVAL_PARAMS_PATH})")
+    parser.add_argument("--start", help="parameter file to start from instead of the built-in values")
+    parser.add_argument("--iterations", type=int, default=TUNE_ITERATIONS)
+    parser.add_argument("--rate", type=float, default=LEARNING_RATE, help="Adam step size in centipawns")
+    parser.add_argument("--scaling", type=float, help="sigmoid scaling constant (default fitted to the starting parameters)")
+    parser.add_argument("--split-endgame", action="store_true", help="give every piece its own endgame piece-square table")
+    args = parser.parse_args(argv)
+
+    if args.start:
+        load_evaluation_parameters(args.start)
+    parameters = evaluation_parameters()
+    endgame_types = TUNED_TYPES if args.split_endgame else [piece_type for piece_type in TUNED_TYPES if piece_type in ENDGAME_PIECE_SQUARE_TABLES]
+    dataset = TuningSet(read_labeled_positions(args.data))
+    print(f"{len(dataset)} positions")
+    vector = parameter_vector(parameters, endgame_types)
+    scores = evaluate_dataset(dataset, vector, endgame_types)
+    scaling = args.scaling or fit_scaling(dataset, scores)
+    print(f"scaling {scaling:.4f}, starting error {mean_error(dataset, scores, scaling):.6f}")
+
+    vector = tune(dataset, vector, endgame_types, scaling, args.iterations, args.rate)
+    tuned = vector_parameters(vector, endgame_types, parameters["piece_values"][PIECE_NAMES[Piece.King]])
+    # The error again with the rounded values that are actually written
+    scores = evaluate_dataset(dataset, parameter_vector(tuned, endgame_types), endgame_types)
+    print(f"final error {mean_error(dataset, scores, scaling):.6f}")
+    save_evaluation_parameters(args.output, tuned)
+    print(f"parameters written to {args.output}")
+
+precompute_tuning_tables()
+
+if __name__ == "__main__":
+    sys.exit(main())
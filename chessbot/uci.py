@@ -0,0 +1,258 @@
+import os
+import sys
+import threading
+
+from chessbot.pieces import Piece
+from chessbot.board import STARTING_FEN, Board, load_position_from_fen, make_move
+from chessbot.movegen import move_to_uci, parse_uci_move
+from chessbot.perft import divide
+from chessbot.book import OpeningBook
+from chessbot.tablebase import TB_WIN_SCORE, TB_MAX_DISTANCE, tablebases
+from chessbot.evaluation import EVAL_PARAMS_PATH, load_evaluation_parameters
+from chessbot.nnue import NNUE_PATH, network
+from chessbot.search import MAX_PLY, MATE_SCORE, SearchController, is_mate_score, iterative_deepening, principal_variation, clear_move_ordering
+from chessbot import search
+
+ENGINE_NAME = "ChessBot"
+ENGINE_AUTHOR = "abdullahmashhadi"
+# Time kept back for the GUI and the pipe, in milliseconds
+MOVE_OVERHEAD = 50
+DEFAULT_MOVES_TO_GO = 30
+
+def format_score(value):
+    if is_mate_score(value):
+        # Mate scores count down from MATE_SCORE by the plies to mate
+        moves = (MATE_SCORE - int(abs(value)) + 1) // 2
+        return f"mate {moves if value > 0 else -moves}"
+    if abs(value) >= TB_WIN_SCORE - TB_MAX_DISTANCE - MAX_PLY:
+        # Tablebase scores count down from TB_WIN_SCORE by the plies to mate
+        moves = (TB_WIN_SCORE - int(abs(value)) + 1) // 2
+        return f"mate {moves if value > 0 else -moves}"
+    return f"cp {int(value)}"
+
+def parse_go(tokens, turn):
+    # Returns (max_depth, time_limit, soft_time, nodes, infinite, ponder); times are in seconds
+    options = {}
+    flags = set()
+    index = 0
+    while index < len(tokens):
+        token = tokens[index]
+        if token in ("infinite", "ponder"):
+            flags.add(token)
+            index += 1
+        elif token in ("depth", "movetime", "nodes", "wtime", "btime", "winc", "binc", "movestogo") and index + 1 < len(tokens):
+            options[token] = int(tokens[index + 1])
+            index += 2
+        else:
+            index += 1
+
+    max_depth = options.get("depth", MAX_PLY)
+    nodes = options.get("nodes")
+    time_limit = None
+    soft_time = None
+    if "movetime" in options:
+        time_limit = max(options["movetime"] - MOVE_OVERHEAD, 1) / 1000
+    else:
+        remaining = options.get("wtime" if turn == Piece.Light else "btime")
+        if remaining is not None:
+            increment = options.get("winc" if turn == Piece.Light else "binc", 0)
+            moves_to_go = options.get("movestogo", DEFAULT_MOVES_TO_GO)
+            available = max(remaining - MOVE_OVERHEAD, 1)
+            # Aim for an even share of the clock, but let an unfinished iteration run on up to three times that
+            soft = min(available / moves_to_go + increment * 3 / 4, available)
+            soft_time = soft / 1000
+            time_limit = max(soft, min(soft * 3, available / 3)) / 1000
+    return max_depth, time_limit, soft_time, nodes, "infinite" in flags, "ponder" in flags
+
+class UCIEngine():
+    def __init__(self, output=sys.stdout):
+        self.output = output
+        self.board = Board()
+        load_position_from_fen(STARTING_FEN, self.board)
+        self.controller = None
+        self.thread = None
+        self.pending_limits = None
+        # Set by stop or ponderhit; an infinite or ponder search may not report bestmove before then
+        self.released = threading.Event()
+        self.own_book = True
+        self.book = None
+
+    def send(self, line):
+        self.output.write(line + "\n")
+        self.output.flush()
+
+    def handle(self, line):
+        # Returns False once the engine should exit
+        tokens = line.split()
+        if not tokens:
+            return True
+        command = tokens[0]
+        if command == "uci":
+            self.send(f"id name {ENGINE_NAME}")
+            self.send(f"id author {ENGINE_AUTHOR}")
+            self.send(f"option name Hash type spin default {search.transposition_table.size_mb} min 1 max 4096")
+            self.send("option name OwnBook type check default true")
+            self.send("option name BookFile type string default <empty>")
+            self.send("option name TablebasePath type string default <empty>")
+            self.send(f"option name EvalFile type string default {EVAL_PARAMS_PATH}")
+            self.send(f"option name EvalNetwork type string default {NNUE_PATH}")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "setoption":
+            self.set_option(tokens)
+        elif command == "ucinewgame":
+            self.stop()
+            search.transposition_table.clear()
+            clear_move_ordering()
+        elif command == "position":
+            self.stop()
+            self.set_position(tokens[1:])
+        elif command == "go":
+            self.stop()
+            self.go(tokens[1:])
+        elif command == "stop":
+            self.stop()
+        elif command == "ponderhit":
+            self.ponderhit()
+        elif command == "quit":
+            self.stop()
+            if self.book is not None:
+                self.book.close()
+            return False
+        return True
+
+    def set_option(self, tokens):
+        if "name" in tokens and "value" in tokens:
+            name = " ".join(tokens[tokens.index("name") + 1:tokens.index("value")]).lower()
+            value = " ".join(tokens[tokens.index("value") + 1:])
+            if name == "hash":
+                search.transposition_table.resize(max(1, int(value)))
+            elif name == "ownbook":
+                self.own_book = value.lower() == "true"
+            elif name == "bookfile":
+                if self.book is not None:
+                    self.book.close()
+                    self.book = None
+                if value and value != "<empty>":
+                    if os.path.exists(value):
+                        self.book = OpeningBook(value)
+                    else:
+                        self.send(f"info string book file {value} not found")
+            elif name == "tablebasepath":
+                tablebases.close()
+                if value and value != "<empty>":
+                    if os.path.isdir(value):
+                        self.send(f"info string {tablebases.load(value)} tablebases loaded")
+                    else:
+                        self.send(f"info string tablebase directory {value} not found")
+            elif name == "evalfile":
+                # Takes effect from the next position command, which sets the board up with the new tables
+                if os.path.exists(value):
+                    load_evaluation_parameters(value)
+                    self.send(f"info string evaluation parameters loaded from {value}")
+                else:
+                    self.send(f"info string evaluation parameter file {value} not found")
+            elif name == "evalnetwork":
+                # An empty value goes back to the hand-written evaluation
+                network.close()
+                if value and value != "<empty>":
+                    if os.path.exists(value):
+                        network.load(value)
+                        self.send(f"info string network loaded from {value}")
+                    else:
+                        self.send(f"info string network file {value} not found")
+
+    def set_position(self, tokens):
+        board = Board()
+        if tokens and tokens[0] == "fen":
+            end = tokens.index("moves") if "moves" in tokens else len(tokens)
+            load_position_from_fen(" ".join(tokens[1:end]), board)
+        else:
+            load_position_from_fen(STARTING_FEN, board)
+        if "moves" in tokens:
+            for text in tokens[tokens.index("moves") + 1:]:
+                move = parse_uci_move(board, text)
+                if move is None:
+                    self.send(f"info string illegal move {text}")
+                    break
+                make_move(board, move)
+        self.board = board
+
+    def go(self, tokens):
+        if tokens and tokens[0] == "perft" and len(tokens) > 1:
+            counts = divide(self.board.clone(), int(tokens[1]))
+            for move, nodes in counts.items():
+                self.send(f"{move_to_uci(move)}: {nodes}")
+            self.send(f"\nNodes searched: {sum(counts.values())}")
+            return
+        max_depth, time_limit, soft_time, nodes, infinite, ponder = parse_go(tokens, self.board.turn)
+        if self.own_book and self.book is not None and not (infinite or ponder):
+            # Book moves are played at once, without starting a search
+            move = self.book.choose_move(self.board)
+            if move is not None:
+                self.send(f"info string book move {move_to_uci(move)}")
+                self.send(f"bestmove {move_to_uci(move)}")
+                return
+        if ponder:
+            # Pondering runs without limits until ponderhit hands it the real ones
+            self.pending_limits = (max_depth, time_limit, soft_time, nodes)
+            self.controller = SearchController()
+        else:
+            self.pending_limits = None
+            self.controller = SearchController(max_depth, time_limit, soft_time, nodes)
+        self.released.clear()
+        if not (infinite or ponder):
+            self.released.set()
+        search.transposition_table.new_search()
+        self.thread = threading.Thread(target=self.search, args=(self.board.clone(), self.controller), daemon=True)
+        self.thread.start()
+
+    def search(self, board, controller):
+        best_move, value, depth = iterative_deepening(board, controller, verbose=False, on_iteration=self.report)
+        self.released.wait()
+        self.send(f"info string {controller.stats.summary()}")
+        if best_move is None:
+            self.send("bestmove 0000")
+            return
+        line = principal_variation(board, 2)
+        if len(line) > 1 and line[0] == best_move:
+            self.send(f"bestmove {move_to_uci(best_move)} ponder {move_to_uci(line[1])}")
+        else:
+            self.send(f"bestmove {move_to_uci(best_move)}")
+
+    def report(self, board, depth, value, move):
+        controller = self.controller
+        elapsed = controller.elapsed()
+        line = principal_variation(board, depth)
+        if not line or line[0] != move:
+            line = [move]
+        self.send(f"info depth {depth} score {format_score(value)} nodes {controller.nodes} "
+                  f"nps {int(controller.nodes / elapsed) if elapsed > 0 else 0} time {int(elapsed * 1000)} "
+                  f"pv {' '.join(move_to_uci(move) for move in line)}")
+
+    def ponderhit(self):
+        if self.controller is not None and self.pending_limits is not None:
+            self.controller.ponderhit(*self.pending_limits)
+            self.pending_limits = None
+            self.released.set()
+
+    def stop(self):
+        if self.thread is not None:
+            self.controller.stop()
+            self.released.set()
+            self.thread.join()
+            self.thread = None
+
+def main():
+    if os.path.exists(EVAL_PARAMS_PATH):
+        load_evaluation_parameters(EVAL_PARAMS_PATH)
+    if os.path.exists(NNUE_PATH):
+        network.load(NNUE_PATH)
+    engine = UCIEngine()
+    for line in sys.stdin:
+        if not engine.handle(line):
+            break
+
+if __name__ == "__main__":
+    main()
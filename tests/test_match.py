@@ -0,0 +1,82 @@
+import math
+
+import pytest
+
+from chessbot.board import STARTING_FEN, Board, load_position_from_fen, make_move
+from chessbot.movegen import parse_uci_move
+from chessbot.match import MAX_GAME_PLIES, sprt_llr, sprt_bounds, elo_estimate, adjudicate
+
+def board_from_fen(fen):
+    board = Board()
+    load_position_from_fen(fen, board)
+    return board
+
+def play(board, moves, key_counts):
+    for text in moves.split():
+        make_move(board, parse_uci_move(board, text))
+        key_counts[board.zobrist_key] = key_counts.get(board.zobrist_key, 0) + 1
+
+def test_sprt_bounds():
+    lower, upper = sprt_bounds(0.05, 0.05)
+    assert lower == pytest.approx(-2.944, abs=1e-3)
+    assert upper == pytest.approx(2.944, abs=1e-3)
+
+def test_sprt_llr_without_games():
+    assert sprt_llr(0, 0, 0, 0, 5) == 0.0
+
+@pytest.mark.parametrize("wins, draws, losses", [(0, 0, 200), (0, 200, 0), (100, 200, 300)])
+def test_sprt_llr_rejects_a_weaker_engine(wins, draws, losses):
+    lower, upper = sprt_bounds(0.05, 0.05)
+    assert sprt_llr(wins, draws, losses, 0, 5) <= lower
+
+@pytest.mark.parametrize("wins, draws, losses", [(200, 0, 0), (300, 200, 100)])
+def test_sprt_llr_accepts_a_stronger_engine(wins, draws, losses):
+    lower, upper = sprt_bounds(0.05, 0.05)
+    assert sprt_llr(wins, draws, losses, 0, 5) >= upper
+
+def test_sprt_llr_is_antisymmetric():
+    assert sprt_llr(30, 20, 10, -5, 5) == pytest.approx(-sprt_llr(10, 20, 30, -5, 5))
+
+def test_elo_estimate():
+    assert elo_estimate(0, 0, 0) == (0.0, 0.0)
+    elo, margin = elo_estimate(50, 0, 50)
+    assert elo == pytest.approx(0.0, abs=1e-9)
+    assert margin > 0
+    # A 75% score is about 191 Elo
+    elo, margin = elo_estimate(75, 0, 25)
+    assert elo == pytest.approx(190.85, abs=0.01)
+    assert elo_estimate(10, 0, 0) == (math.inf, math.inf)
+    assert elo_estimate(0, 0, 10) == (-math.inf, math.inf)
+
+@pytest.mark.parametrize("fen, expected", [
+    ("rnb1kbnr/pppp1ppp/8/4p3/6Pq/5P2/PPPPP2P/RNBQKBNR w KQkq - 1 3", ("0-1", "checkmate")),
+    ("k7/1Q6/1K6/8/8/8/8/8 b - - 0 1", ("1-0", "checkmate")),
+    ("k7/8/1Q6/8/8/8/8/7K b - - 0 1", ("1/2-1/2", "stalemate")),
+    ("k7/8/8/8/8/8/8/R6K w - - 100 80", ("1/2-1/2", "fifty-move rule")),
+    ("k7/8/8/8/8/8/8/B6K w - - 0 1", ("1/2-1/2", "insufficient material")),
+    (STARTING_FEN, None),
+])
+def test_adjudicate(fen, expected):
+    board = board_from_fen(fen)
+    assert adjudicate(board, {board.zobrist_key: 1}, 0) == expected
+
+def test_adjudicate_move_limit():
+    board = board_from_fen(STARTING_FEN)
+    assert adjudicate(board, {board.zobrist_key: 1}, MAX_GAME_PLIES) == ("1/2-1/2", "move limit")
+
+def test_threefold_repetition():
+    board = board_from_fen(STARTING_FEN)
+    key_counts = {board.zobrist_key: 1}
+    play(board, "g1f3 g8f6 f3g1 f6g8 g1f3 g8f6 f3g1", key_counts)
+    assert adjudicate(board, key_counts, 7) is None
+    play(board, "f6g8", key_counts)
+    assert adjudicate(board, key_counts, 8) == ("1/2-1/2", "threefold repetition")
+
+def test_repetition_after_a_double_push():
+    # After e2e4 no black pawn can take en passant, so the same position comes back once the knights return
+    board = board_from_fen(STARTING_FEN)
+    key_counts = {board.zobrist_key: 1}
+    play(board, "e2e4 g8f6 g1f3 f6g8 f3g1 g8f6 g1f3 f6g8", key_counts)
+    assert adjudicate(board, key_counts, 9) is None
+    play(board, "f3g1", key_counts)
+    assert adjudicate(board, key_counts, 9) == ("1/2-1/2", "threefold repetition")
@@ -0,0 +1,81 @@
+import pytest
+
+from chessbot.board import Board, load_position_from_fen
+from chessbot.tablebase import TB_WIN_SCORE, generate_tables, tablebases
+from chessbot.search import MATE_SCORE, TT_EXACT, TranspositionTable, score_to_tt, score_from_tt
+from chessbot.uci import format_score
+
+# Generating both tables takes about half a minute, so it is done once for the module
+@pytest.fixture(scope="module")
+def tables(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("tablebases")
+    generate_tables(["KQvK", "KRvK"], str(directory), verbose=False)
+    tablebases.load(str(directory))
+    yield tablebases
+    tablebases.close()
+
+def board_from_fen(fen):
+    board = Board()
+    load_position_from_fen(fen, board)
+    return board
+
+@pytest.mark.parametrize("fen, expected", [
+    # Qb8 and Rh8 mate at once
+    ("7k/8/6K1/8/8/8/8/1Q6 w - - 0 1", (1, 1)),
+    ("k7/8/1K6/8/8/8/8/7R w - - 0 1", (1, 1)),
+    # Kb6 first, then Rh8 mate
+    ("k7/8/2K5/8/8/8/8/7R w - - 0 1", (1, 3)),
+    # Already mated
+    ("k7/1Q6/1K6/8/8/8/8/8 b - - 0 1", (-1, 0)),
+    ("8/8/8/8/8/8/8/kQK5 b - - 0 1", (-1, 0)),
+    # Stalemate
+    ("k7/8/1Q6/8/8/8/8/7K b - - 0 1", (0, None)),
+    # Bare kings need no table
+    ("k7/8/8/8/8/8/8/7K w - - 0 1", (0, None)),
+])
+def test_probe(tables, fen, expected):
+    assert tables.probe(board_from_fen(fen)) == expected
+
+def test_longest_mates(tables):
+    # The known maxima, mate in 10 moves with a queen and 16 with a rook, reached with the lone king to move
+    assert max(tables.tables["KQvK"][:]) - 1 == 20
+    assert max(tables.tables["KRvK"][:]) - 1 == 32
+
+def test_uncovered_position(tables):
+    assert tables.probe(board_from_fen("k7/8/8/8/8/8/8/RR5K w - - 0 1")) is None
+
+def test_probe_score_counts_from_the_root(tables):
+    board = board_from_fen("k7/8/2K5/8/8/8/8/7R w - - 0 1")
+    assert tables.probe_score(board) == TB_WIN_SCORE - 3
+    assert tables.probe_score(board, 4) == TB_WIN_SCORE - 7
+    mated = board_from_fen("k7/1Q6/1K6/8/8/8/8/8 b - - 0 1")
+    assert tables.probe_score(mated, 5) == -(TB_WIN_SCORE - 5)
+    assert tables.probe_score(board_from_fen("k7/8/1Q6/8/8/8/8/7K b - - 0 1"), 5) == 0
+
+@pytest.mark.parametrize("score", [TB_WIN_SCORE - 7, -(TB_WIN_SCORE - 7), MATE_SCORE - 9, -(MATE_SCORE - 9)])
+def test_distance_scores_move_with_the_ply(score):
+    # Stored at ply 4 and found again at ply 6: the mate is still as far from the node, so two plies further from the root
+    table = TranspositionTable(1)
+    key = 0x123456789ABCDEF
+    table.store(key, 3, score_to_tt(score, 4), TT_EXACT, (12, 28))
+    depth, stored, bound, move = table.probe(key)
+    assert (depth, bound, move) == (3, TT_EXACT, (12, 28))
+    assert score_from_tt(stored, 4) == score
+    assert score_from_tt(stored, 6) == (score - 2 if score > 0 else score + 2)
+
+def test_ordinary_scores_are_stored_unchanged():
+    assert score_to_tt(150, 7) == 150
+    assert score_from_tt(-150, 7) == -150
+
+@pytest.mark.parametrize("value, expected", [
+    (MATE_SCORE - 1, "mate 1"),
+    (MATE_SCORE - 3, "mate 2"),
+    (-(MATE_SCORE - 2), "mate -1"),
+    (-(MATE_SCORE - 4), "mate -2"),
+    (TB_WIN_SCORE - 3, "mate 2"),
+    (-(TB_WIN_SCORE - 4), "mate -2"),
+    (35, "cp 35"),
+    (-120, "cp -120"),
+])
+def test_format_score(value, expected):
+    assert format_score(value) == expected